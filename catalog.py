@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""Downloads all of the sections in some subjects ahead of time.
+
+For example, to get all of the EECS and MATH sections for Fall 2014:
+
+    ./catalog.py prefetch "FA 2014" EECS MATH
+
+This can take a long time, because of the rate limit. If it's stopped, running
+it again carries on where it left off. Once it's done, schedules for classes
+in those subjects can be made without fetching any sections.
+
+To bring the catalog up to date later, fetching only the sections which were
+added and the ones which were fetched more than a day ago, and to print what
+changed:
+
+    ./catalog.py sync "FA 2014" EECS MATH --max-age 24
+
+"""
+import argparse
+import logging
+
+import schedumich.umich as umich
+
+
+def get_api_key():
+    """Get the access token to use for the umich API."""
+    with open("access_token") as f:
+        return f.read().strip()
+
+
+def prefetch(args):
+    """Fetch all of the sections in some subjects into the term's catalog."""
+    class_api = umich.ClassAPI(access_key=get_api_key())
+    term = umich.Term.from_season(class_api, args.season)
+
+    catalog = umich.Catalog(umich.Catalog.get_file_name(args.season))
+    catalog.load()
+    term.prefetch_catalog(catalog, args.subjects)
+    class_api.close()
+
+    logging.info("The catalog has {num_sections} sections.".format(
+        num_sections=len(catalog)
+    ))
+
+
+def sync(args):
+    """Update the sections in some subjects in the term's catalog, and print
+    the ones which changed."""
+    class_api = umich.ClassAPI(access_key=get_api_key())
+    term = umich.Term.from_season(class_api, args.season)
+
+    catalog = umich.Catalog(umich.Catalog.get_file_name(args.season))
+    catalog.load()
+    changes = term.sync_catalog(
+        catalog,
+        args.subjects,
+        max_age=args.max_age * 60 * 60,
+        limit=args.limit
+    )
+    class_api.close()
+
+    for i in changes:
+        print(i)
+    logging.info("{num_changes} sections changed.".format(
+        num_changes=len(changes)
+    ))
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(
+        description="Download the sections for a term ahead of time."
+    )
+    subparsers = parser.add_subparsers()
+
+    prefetch_parser = subparsers.add_parser(
+        "prefetch",
+        help="Fetch all of the sections in some subjects."
+    )
+    prefetch_parser.add_argument(
+        "season",
+        help='The season of the term, like "FA 2014".'
+    )
+    prefetch_parser.add_argument(
+        "subjects",
+        nargs="+",
+        help='The subject codes, like "EECS".'
+    )
+    prefetch_parser.set_defaults(command=prefetch)
+
+    sync_parser = subparsers.add_parser(
+        "sync",
+        help="Update the sections in some subjects."
+    )
+    sync_parser.add_argument(
+        "season",
+        help='The season of the term, like "FA 2014".'
+    )
+    sync_parser.add_argument(
+        "subjects",
+        nargs="+",
+        help='The subject codes, like "EECS".'
+    )
+    sync_parser.add_argument(
+        "--max-age",
+        type=float,
+        default=24,
+        help="Fetch sections again if they were fetched more than this many "
+        "hours ago."
+    )
+    sync_parser.add_argument(
+        "--limit",
+        type=int,
+        help="The most sections to fetch again because they're too old."
+    )
+    sync_parser.set_defaults(command=sync)
+
+    args = parser.parse_args()
+    if not hasattr(args, "command"):
+        parser.error("No command given.")
+    args.command(args)
+
+if __name__ == "__main__":
+    main()
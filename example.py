@@ -33,19 +33,18 @@ LUNCH = umich.MeetingTime.from_days_and_times(
     "11:00AM - 12:00PM"
 )
 SLEEP = umich.MeetingTime.from_days_and_times(
-    "MoTuWeThrFr",
+    "MoTuWeThFr",
     "1:00AM - 10:00AM"
 )
 # additional_times = [LUNCH, SLEEP]
 additional_times = []
 
 
-def doesnt_conflict_with(time_period):
-    def ret(candidate):
-        return not any(
-            section.meeting_time.conflicts_with(time_period)
-            for section in candidate
-        )
+def doesnt_conflict_with(time_periods):
+    blocked_mask = umich.MeetingTime.combined_mask(time_periods)
+
+    def ret(section):
+        return not section.meeting_time.week_mask & blocked_mask
     return ret
 
 
@@ -55,29 +54,59 @@ def main():
     with umich.make_cache("class_api.cache") as class_api_cache:
         with umich.make_cache("building_api.cache") as building_api_cache:
             access_key = get_api_key()
+
+            # Both APIs count against the same rate limit.
+            rate_limiter = umich.BaseAPI.RateLimiter.shared(access_key)
             class_api = umich.ClassAPI(
                 access_key=access_key,
-                cache=class_api_cache
+                cache=class_api_cache,
+                rate_limiter=rate_limiter
             )
             building_api = umich.BuildingAPI(
                 access_key=access_key,
-                cache=building_api_cache
+                cache=building_api_cache,
+                rate_limiter=rate_limiter
             )
             section_group_names = Input.get_section_group_names()
             season = Input.get_season()
 
-            class_picker = scheduler.ClassPicker(class_api, building_api)
-            schedules = class_picker.pick_sections(section_group_names, season)
+            # Read sections from the catalog made by `catalog.py prefetch`, if
+            # there is one.
+            catalog = umich.Catalog(umich.Catalog.get_file_name(season))
+            catalog.load()
+            if catalog.term_info:
+                class_api.add_catalog(catalog)
 
-            # Add additional criteria.
-            for i in additional_times:
-                class_picker.add_criterion(doesnt_conflict_with(i))
+            class_picker = scheduler.ClassPicker(class_api, building_api)
 
-            # Display all the schedules to the user, one-by-one.
+            # Add additional criteria. This one only needs to look at one
+            # section at a time, so it can rule sections out before the search
+            # even starts.
+            if additional_times:
+                class_picker.add_section_filter(
+                    doesnt_conflict_with(additional_times)
+                )
+
+            # Display all the schedules to the user, one-by-one, as they're
+            # found.
+            schedules = class_picker.iter_sections(section_group_names, season)
             for i in schedules:
                 scheduler.print_schedule(i)
                 if input() == "q":
                     break
 
+            logging.info("Class API requests: {}".format(
+                dict(class_api.request_stats)
+            ))
+
+            # Count which classes were looked up, so that syncing the catalog
+            # brings them up to date first.
+            if catalog.term_info:
+                catalog.save_queries()
+
+            # Let any responses being refreshed make it into the caches.
+            class_api.close()
+            building_api.close()
+
 if __name__ == "__main__":
     main()
@@ -1,24 +1,105 @@
 #!/usr/bin/env python3
-import datetime
+import collections
+import concurrent.futures
+import heapq
 import itertools
 import time
 
 from . import umich
 
 
+def _day_masks(schedule):
+    """Yields the part of the week mask for each day the schedule meets on.
+
+    Each one is shifted down so that bit `i` is minute `i` of the day.
+
+    """
+    minutes_per_day = umich.MeetingTime.MINUTES_PER_DAY
+    week_mask = umich.MeetingTime.combined_mask(
+        i.meeting_time
+        for i
+        in schedule
+    )
+    while week_mask:
+        day_mask = week_mask & ((1 << minutes_per_day) - 1)
+        if day_mask:
+            yield day_mask
+        week_mask >>= minutes_per_day
+
+
+def idle_minutes(schedule):
+    """Objective: the minutes spent between classes, over the whole week."""
+    total = 0
+    for day_mask in _day_masks(schedule):
+        first_minute = (day_mask & -day_mask).bit_length() - 1
+        last_minute = day_mask.bit_length()
+        total += (last_minute - first_minute) - bin(day_mask).count("1")
+    return total
+
+
+def early_start(schedule):
+    """Objective: how early in the day the earliest class of the week starts.
+
+    This is the number of minutes from when that class starts until midnight,
+    so schedules which start later are better.
+
+    """
+    return max(
+        (
+            umich.MeetingTime.MINUTES_PER_DAY -
+            ((day_mask & -day_mask).bit_length() - 1)
+            for day_mask
+            in _day_masks(schedule)
+        ),
+        default=0
+    )
+
+
+def days_on_campus(schedule):
+    """Objective: the number of days in the week with any classes."""
+    return sum(1 for i in _day_masks(schedule))
+
+
+MONOTONE_OBJECTIVES = {early_start, days_on_campus}
+"""The built-in objectives whose scores never go down as sections are added.
+
+See `ClassPicker.add_objective`.
+
+"""
+
+
 class ClassPicker:
     """Picks classes as according to some arbitrary criteria."""
 
-    def __init__(self, class_api, building_api):
+    SEARCH_BATCH_SIZE = 1000
+    """When searching with several processes, the most solutions a process
+    finds before handing them back."""
+
+    SEARCH_BATCH_NODES = 20000
+    """When searching with several processes, the most nodes a process visits
+    before handing back the solutions it has found."""
+
+    SEARCH_BATCHES_AHEAD = 4
+    """When searching with several processes, the most batches of solutions
+    to keep for a part of the search which isn't being used yet."""
+
+    def __init__(self, class_api, building_api, workers=1):
         """Constructor.
 
         class_api: The ClassAPI instance.
         building_api: The BuildingAPI instance.
+        workers: The number of processes to search with. If more than one,
+            the search is split up by the section picked for the most
+            constrained section list, and the parts are searched in parallel.
 
         """
         self.class_api = class_api
         self.building_api = building_api
+        self.workers = workers
         self.criteria = []
+        self.section_filters = []
+        self.pair_constraints = []
+        self.objectives = []
 
     def _get_section_choices(self, section_groups):
         """Transform a list of section groups into its sections.
@@ -39,11 +120,19 @@ class ClassPicker:
         return ret
 
     def _get_section_groups(self, section_group_names, season):
-        section_groups = {}
-        for i in section_group_names:
-            term = umich.Term.from_season(self.class_api, season)
-            section_groups[i] = term.get_section_group(i)
-        return section_groups
+        if not section_group_names:
+            return {}
+
+        # Fetch all of the section groups at the same time. The class API
+        # keeps its requests under the rate limit.
+        term = umich.Term.from_season(self.class_api, season)
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=len(section_group_names)
+        ) as executor:
+            return dict(zip(
+                section_group_names,
+                executor.map(term.get_section_group, section_group_names)
+            ))
 
     def add_criterion(self, criterion):
         """Add an additional criterion to the scheduling.
@@ -54,62 +143,272 @@ class ClassPicker:
         """
         self.criteria.append(criterion)
 
-    def pick_sections(self, section_group_names, season):
+    def add_section_filter(self, section_filter):
+        """Add a criterion which looks at one section at a time.
+
+        Sections which don't pass are never considered, so this is much
+        cheaper than a criterion which looks at the whole schedule.
+
+        section_filter: A function taking a section and returning True if
+            that section is acceptable and False otherwise.
+
+        """
+        self.section_filters.append(section_filter)
+
+    def add_pair_constraint(self, pair_constraint):
+        """Add a criterion which looks at two sections at a time.
+
+        Like the time and campus rules, this is checked once for each pair of
+        sections from different section lists before the search starts, and a
+        partial schedule is dropped as soon as it has a pair which doesn't
+        pass.
+
+        pair_constraint: A function taking two sections and returning True if
+            they can be taken together and False otherwise.
+
+        """
+        self.pair_constraints.append(pair_constraint)
+
+    def add_objective(self, objective, weight=1, monotone=False):
+        """Add an objective to rank schedules by in `pick_best`.
+
+        A schedule's score is the weighted sum of its objectives, and lower
+        scores are better. There are some built-in objectives in this module,
+        like `idle_minutes`, `early_start` and `days_on_campus`.
+
+        objective: A function taking a schedule and returning a non-negative
+            number.
+        weight: A non-negative number to multiply the objective by.
+        monotone: Whether the objective's score for a partial schedule never
+            goes down as more sections are added to it. `pick_best` uses the
+            score of a partial schedule to skip it if it can't beat the
+            schedules found so far. Such objectives should only look at the
+            sections' meeting times and campuses. This is always true for the
+            built-in objectives in `MONOTONE_OBJECTIVES`.
+
+        """
+        monotone = monotone or objective in MONOTONE_OBJECTIVES
+        self.objectives.append((objective, weight, monotone))
+
+    def iter_sections(
+        self,
+        section_group_names,
+        season,
+        limit=None,
+        timeout=None,
+        max_nodes=None,
+        progress=None
+    ):
+        """Yields the schedules which meet all of the criteria.
+
+        Schedules are yielded as soon as the search finds them, so the first
+        few can be used before the rest of the search has finished. Nothing
+        is kept around after it's been yielded.
+
+        section_group_names: The section groups to enroll in, like
+            ["EECS 281", "EECS 370"].
+        season: The season code, such as "FA 2014".
+        limit: The maximum number of schedules to yield, or `None` to yield
+            all of them.
+        timeout, max_nodes, progress: See `SearchStats`. The search stops
+            early if it runs out of time or nodes, and `progress` is told
+            whether it finished.
+
+        """
         section_choices = self._get_section_choices(self._get_section_groups(
             section_group_names, season
         ))
+        stats = SearchStats(
+            timeout=timeout,
+            max_nodes=max_nodes,
+            progress=progress
+        )
+        return itertools.islice(self._search(section_choices, stats), limit)
+
+    def pick_sections(
+        self,
+        section_group_names,
+        season,
+        timeout=None,
+        max_nodes=None,
+        progress=None
+    ):
+        """Picks every schedule which meets all of the criteria.
+
+        Returns a `ScheduleList` of schedules. Each schedule is a tuple with
+        one section from each of the section choices. See `iter_sections` to
+        get the schedules one at a time instead.
+
+        section_group_names: The section groups to enroll in, like
+            ["EECS 281", "EECS 370"].
+        season: The season code, such as "FA 2014".
+        timeout, max_nodes, progress: See `SearchStats`. If the search stops
+            early, the schedules found so far are returned, and the list's
+            `finished` is False.
 
-        def times_dont_overlap(candidate):
-            for s1, s2 in itertools.combinations(candidate, 2):
-                if s1.meeting_time.conflicts_with(s2.meeting_time):
-                    return False
-            return True
+        """
+        section_choices = self._get_section_choices(self._get_section_groups(
+            section_group_names, season
+        ))
+        stats = SearchStats(
+            timeout=timeout,
+            max_nodes=max_nodes,
+            progress=progress
+        )
+        return ScheduleList(self._search(section_choices, stats), stats)
 
-        def buildings_arent_too_far_away(candidate):
-            # Minimum time between classes on different campuses.
-            TIME_BETWEEN_CAMPUSES = datetime.timedelta(minutes=30)
+    def pick_best(self, section_group_names, season, k):
+        """Picks the best schedules according to the objectives.
 
-            def get_building(section):
-                return umich.Building.from_section(self.building_api, section)
+        Returns a list of up to `k` schedules, in the same form as
+        `pick_sections`, best first. Schedules which score the same are in the
+        order that `pick_sections` would return them in. Partial schedules
+        which can't beat the `k` best found so far are skipped, using the
+        monotone objectives, so it's much faster than scoring every schedule.
 
-            for s1, s2 in itertools.combinations(candidate, 2):
-                s1_building = get_building(s1)
-                s2_building = get_building(s2)
+        This always searches with one process.
 
-                # They don't both have assigned locations, so we can't tell
-                # right now. In that case, we assume that they don't conflict.
-                if not s1_building or not s2_building:
-                    continue
+        section_group_names: The section groups to enroll in, like
+            ["EECS 281", "EECS 370"].
+        season: The season code, such as "FA 2014".
+        k: The number of schedules to pick.
 
-                # If they're on the same campus, we can't have a timing
-                # conflict between them.
-                if s1_building.campus_name == s2_building.campus_name:
-                    continue
+        """
+        if k <= 0:
+            return []
 
-                # If they're not on the same day, we can't have a timing
-                # conflict.
-                if not(
-                    set(s1.meeting_time.day_list) &
-                    set(s2.meeting_time.day_list)
-                ):
-                    continue
+        # Without any objectives, every schedule is as good as any other.
+        if not self.objectives:
+            return list(self.iter_sections(section_group_names, season, k))
 
-                # Order them with respect to time.
-                s1, s2 = sorted(
-                    [s1, s2],
-                    key=lambda x: x.meeting_time.time_begin
-                )
-
-                # They're on different campuses, so make sure they're far
-                # enough apart in time.
-                time_difference = umich.MeetingTime.time_difference(
-                    s1.meeting_time.time_end,
-                    s2.meeting_time.time_begin
-                )
-                if time_difference < TIME_BETWEEN_CAMPUSES:
-                    return False
-            return True
+        section_choices = self._get_section_choices(self._get_section_groups(
+            section_group_names, season
+        ))
+        search_space, section_options = self._make_search_space(
+            section_choices
+        )
 
+        def score(candidate, only_monotone=False):
+            return sum(
+                weight * objective(candidate)
+                for objective, weight, monotone
+                in self.objectives
+                if monotone or not only_monotone
+            )
+
+        # The `k` best schedules so far, as a heap with the worst one on top.
+        # Later schedules are worse than earlier ones with the same score.
+        best = []
+        counter = itertools.count()
+
+        def cant_beat_best(partial_solution):
+            if len(best) < k:
+                return False
+
+            # Sections from the same node have the same meeting times and
+            # campus, so any of them will do for the monotone objectives.
+            partial_candidate = [
+                section_options[i][0]
+                for i
+                in partial_solution
+            ]
+            worst_score = -best[0][0]
+            return score(partial_candidate, only_monotone=True) >= worst_score
+
+        stats = SearchStats()
+        has_bound = any(monotone for _, _, monotone in self.objectives)
+        for candidate in self._expand_solutions(
+            search_space.solutions(
+                prune=cant_beat_best if has_bound else None,
+                stats=stats
+            ),
+            search_space,
+            section_options,
+            stats
+        ):
+            entry = (-score(candidate), -next(counter), candidate)
+            if len(best) < k:
+                heapq.heappush(best, entry)
+            elif entry[0] > best[0][0]:
+                heapq.heapreplace(best, entry)
+
+        return [
+            candidate
+            for _, _, candidate
+            in sorted(best, key=lambda i: (-i[0], -i[1]))
+        ]
+
+    def count_schedules(self, section_group_names, season):
+        """Counts the schedules which meet the time and campus rules.
+
+        This is much faster than counting the schedules from `pick_sections`,
+        since the schedules are never made. Section filters and pair
+        constraints are taken into account, but the custom criteria are
+        ignored, because they can only be checked against whole schedules.
+
+        section_group_names: The section groups to enroll in, like
+            ["EECS 281", "EECS 370"].
+        season: The season code, such as "FA 2014".
+
+        """
+        section_choices = self._get_section_choices(self._get_section_groups(
+            section_group_names, season
+        ))
+        search_space, section_options = self._make_search_space(
+            section_choices
+        )
+        return search_space.count([len(i) for i in section_options])
+
+    def _search(self, section_choices, stats):
+        """Finds the schedules which can be made from the section choices.
+
+        The sections which can be taken together are worked out once, up
+        front, and then `SearchSpace` does a depth-first search over them.
+        Interchangeable sections are searched as one, and each solution is
+        expanded back into every schedule it stands for. The custom criteria
+        only look at complete schedules, so they're checked last.
+
+        Returns an iterator of schedules in the same form as `pick_sections`.
+
+        section_choices: A list of lists of sections, as returned by
+            `_get_section_choices`.
+        stats: The `SearchStats` for the search.
+
+        """
+        search_space, section_options = self._make_search_space(
+            section_choices
+        )
+
+        if self.workers > 1:
+            solutions = self._parallel_solutions(search_space, stats)
+        else:
+            solutions = search_space.solutions(stats=stats)
+
+        return self._expand_solutions(
+            solutions,
+            search_space,
+            section_options,
+            stats
+        )
+
+    def _expand_solutions(
+        self,
+        solutions,
+        search_space,
+        section_options,
+        stats
+    ):
+        """Yields the schedules for solutions which meet all of the criteria.
+
+        Once the solutions run out, marks the search as finished if it
+        wasn't stopped early and gives a last progress report.
+
+        solutions: A generator of solutions from the search space.
+        search_space: The `SearchSpace`.
+        section_options: The sections for each node in the search space.
+        stats: The `SearchStats` for the search.
+
+        """
         def are_criteria_met(candidate):
             return all(
                 criterion(candidate)
@@ -117,14 +416,652 @@ class ClassPicker:
                 in self.criteria
             )
 
-        return [
-            i
+        try:
+            for solution in solutions:
+                options = [None] * len(search_space.domains)
+                for choice_index, node in zip(search_space.order, solution):
+                    options[choice_index] = section_options[node]
+                # One solution can stand for a huge number of schedules, so
+                # the limits are checked while they're being tried, too.
+                for candidate in itertools.product(*options):
+                    if not stats.check_candidate():
+                        break
+                    if are_criteria_met(candidate):
+                        stats.found += 1
+                        yield candidate
+                if stats.stopped:
+                    break
+        finally:
+            # Let the search put its last counts into `stats` before the last
+            # report.
+            solutions.close()
+
+        stats.finished = not stats.stopped
+        if stats.progress:
+            stats.progress(stats)
+
+    def _make_search_space(self, section_choices):
+        """Works out which pairs of sections can be taken together.
+
+        Sections which don't pass the section filters are left out. Sections
+        in the same section list which meet at the same times on the same
+        campus can't be told apart by the time and campus rules, so they're
+        put together into one node of the search space. Big classes tend to
+        have a lot of these.
+
+        Returns a tuple of the `SearchSpace` and a list with the sections for
+        each node in the search space, at that node's index.
+
+        section_choices: A list of lists of sections, as returned by
+            `_get_section_choices`.
+
+        """
+        # Minimum time between classes on different campuses, in minutes.
+        TIME_BETWEEN_CAMPUSES = 30
+
+        building_index = self.building_api.get_building_index()
+        section_options = []
+        buildings = []
+        domains = []
+        for i in section_choices:
+            domain = []
+            nodes = {}
+            for section in i:
+                if not all(
+                    section_filter(section)
+                    for section_filter
+                    in self.section_filters
+                ):
+                    continue
+
+                building = building_index.get_building(section)
+
+                # If the week mask doesn't describe the meeting time exactly,
+                # or there are pair constraints which might look at more than
+                # the times and campus, then don't assume the section is like
+                # any other.
+                if (
+                    section.meeting_time.mask_is_exact and
+                    not self.pair_constraints
+                ):
+                    key = (
+                        section.meeting_time.week_mask,
+                        building.campus_name if building else None,
+                    )
+                else:
+                    key = section
+
+                try:
+                    section_options[nodes[key]].append(section)
+                except KeyError:
+                    nodes[key] = len(section_options)
+                    domain.append(len(section_options))
+                    section_options.append([section])
+                    buildings.append(building)
+            domains.append(domain)
+
+        # Every section in a node behaves the same, so use the first one to
+        # stand in for the rest.
+        sections = [i[0] for i in section_options]
+
+        def times_dont_overlap(n1, n2):
+            return not sections[n1].meeting_time.conflicts_with(
+                sections[n2].meeting_time
+            )
+
+        def buildings_arent_too_far_away(n1, n2):
+            s1_building = buildings[n1]
+            s2_building = buildings[n2]
+
+            # They don't both have assigned locations, so we can't tell right
+            # now. In that case, we assume that they don't conflict.
+            if not s1_building or not s2_building:
+                return True
+
+            # If they're on the same campus, we can't have a timing conflict
+            # between them.
+            if s1_building.campus_name == s2_building.campus_name:
+                return True
+
+            s1 = sections[n1]
+            s2 = sections[n2]
+
+            # If they're not on the same day, we can't have a timing conflict.
+            if not(
+                set(s1.meeting_time.day_list) &
+                set(s2.meeting_time.day_list)
+            ):
+                return True
+
+            # Order them with respect to time.
+            s1, s2 = sorted(
+                [s1, s2],
+                key=lambda x: x.meeting_time.time_begin
+            )
+
+            # They're on different campuses, so make sure they're far enough
+            # apart in time.
+            time_difference = (
+                s2.meeting_time.time_begin - s1.meeting_time.time_end
+            )
+            return time_difference >= TIME_BETWEEN_CAMPUSES
+
+        def are_pair_constraints_met(n1, n2):
+            return all(
+                pair_constraint(sections[n1], sections[n2])
+                for pair_constraint
+                in self.pair_constraints
+            )
+
+        # Each pair of sections from different section lists is only checked
+        # once, no matter how many candidate schedules it shows up in.
+        compatible = [0] * len(sections)
+        for d1, d2 in itertools.combinations(domains, 2):
+            for n1 in d1:
+                for n2 in d2:
+                    if (
+                        times_dont_overlap(n1, n2) and
+                        buildings_arent_too_far_away(n1, n2) and
+                        are_pair_constraints_met(n1, n2)
+                    ):
+                        compatible[n1] |= 1 << n2
+                        compatible[n2] |= 1 << n1
+
+        return SearchSpace(domains, compatible), section_options
+
+    def _parallel_solutions(self, search_space, stats):
+        """Yields the solutions for a search space, using several processes.
+
+        Each process gets a copy of the search space, which is only made up of
+        integers. The search is split up by the node picked for the first
+        choice, and each part is searched a batch at a time, each batch
+        carrying on from where the last one stopped. This way, the solutions
+        come back as they're found, and in the same order that
+        `SearchSpace.solutions` would yield them in. The next few parts are
+        searched ahead while the current one is being used, up to
+        `SEARCH_BATCHES_AHEAD` batches each.
+
+        Each batch may use up the rest of the time and node limits. The
+        solutions from a batch are handed on before its counts are added to
+        `stats`, so that the schedules it has already found are tried even if
+        it used up the limits. After that, the rest of the search is dropped.
+
+        search_space: The `SearchSpace` to search.
+        stats: The `SearchStats` for the search.
+
+        """
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_search_worker,
+            initargs=(search_space,)
+        )
+
+        def submit(shard):
+            if (
+                shard.done or
+                shard.future or
+                len(shard.batches) >= self.SEARCH_BATCHES_AHEAD
+            ):
+                return
+
+            max_nodes = self.SEARCH_BATCH_NODES
+            if stats.max_nodes is not None:
+                max_nodes = max(0, min(
+                    max_nodes,
+                    stats.max_nodes - stats.nodes - stats.candidates
+                ))
+            shard.future = executor.submit(
+                _search_shard,
+                shard.node,
+                shard.start,
+                stats.deadline,
+                max_nodes,
+                self.SEARCH_BATCH_SIZE
+            )
+
+        def collect(shard):
+            solutions, shard_stats, shard.start = shard.future.result()
+            shard.future = None
+            shard.done = shard.start is None
+            shard.batches.append((solutions, shard_stats))
+
+        shards = collections.deque(search_space.shards())
+        window = collections.deque()
+        try:
+            while shards or window:
+                # Search a few more parts than there are processes, so that
+                # there's something for each of them to do while the first
+                # part is being used.
+                while shards and len(window) < 2 * self.workers:
+                    window.append(_Shard(shards.popleft()))
+                for i in window:
+                    submit(i)
+
+                shard = window[0]
+                if not shard.batches:
+                    concurrent.futures.wait(
+                        [
+                            i.future
+                            for i
+                            in window
+                            if i.future
+                        ],
+                        return_when=concurrent.futures.FIRST_COMPLETED
+                    )
+                    for i in window:
+                        if i.future and i.future.done():
+                            collect(i)
+                    continue
+
+                solutions, shard_stats = shard.batches.popleft()
+                try:
+                    yield from solutions
+                finally:
+                    stats.add(shard_stats)
+                if stats.stopped:
+                    break
+                if shard.done and not shard.batches:
+                    window.popleft()
+        finally:
+            # If we stopped early, drop the batches which haven't started.
+            # The ones which have are short, so they're waited for, and then
+            # the processes exit.
+            executor.shutdown(cancel_futures=True)
+
+
+# The search space for the current worker process. See `_search_shard`.
+_worker_search_space = None
+
+
+def _init_search_worker(search_space):
+    global _worker_search_space
+    _worker_search_space = search_space
+
+
+def _search_shard(shard, start, deadline, max_nodes, max_solutions):
+    """Searches one batch of a shard of the search space.
+
+    Returns a tuple of the list of solutions, the `SearchStats`, and where to
+    carry on searching the shard from, or `None` if it's done. See
+    `SearchSpace.solutions`.
+
+    """
+    stats = SearchStats(max_nodes=max_nodes)
+    stats.deadline = deadline
+    solutions = list(itertools.islice(
+        _worker_search_space.solutions(shard, stats=stats, start=start),
+        max_solutions
+    ))
+
+    if stats.stopped:
+        start = stats.stopped_at
+    elif len(solutions) == max_solutions:
+        start = solutions[-1] + (None,)
+    else:
+        start = None
+    return solutions, stats, start
+
+
+class _Shard:
+    """A shard of the search space being searched in another process."""
+
+    def __init__(self, node):
+        """Constructor.
+
+        node: The node for the first choice. See `SearchSpace.shards`.
+
+        """
+        self.node = node
+
+        self.start = None
+        """Where to carry on searching from."""
+
+        self.done = False
+        """Whether the whole shard has been searched."""
+
+        self.future = None
+        """The future for the batch being searched, if any."""
+
+        self.batches = collections.deque()
+        """The batches of solutions and their `SearchStats` which haven't been
+        used yet."""
+
+
+class SearchStats:
+    """Keeps track of how a search is going, and stops it if it takes too long.
+
+    """
+    REPORT_INTERVAL = 1000
+    """The number of nodes to visit between progress reports."""
+
+    def __init__(self, timeout=None, max_nodes=None, progress=None):
+        """Constructor.
+
+        timeout: The number of seconds the search may take, or `None`.
+        max_nodes: The number of nodes the search may visit, plus the number
+            of schedules it may check against the criteria, or `None`.
+        progress: A function which is called with this object every
+            `REPORT_INTERVAL` nodes or candidates, and once more when the
+            search ends.
+
+        """
+        self.nodes = 0
+        """The number of nodes visited so far."""
+
+        self.pruned = 0
+        """The number of nodes which were ruled out, along with everything
+        which would have come after them."""
+
+        self.candidates = 0
+        """The number of schedules checked against the criteria so far."""
+
+        self.found = 0
+        """The number of schedules found so far."""
+
+        self.stopped = False
+        """Whether the search was stopped because of a limit."""
+
+        self.finished = False
+        """Whether the search went all the way to the end."""
+
+        self.stopped_at = None
+        """If the search was stopped, where to carry it on from. See
+        `SearchSpace.solutions`."""
+
+        self.deadline = None if timeout is None else time.time() + timeout
+        self.max_nodes = max_nodes
+        self.progress = progress
+
+    def __repr__(self):
+        """Repr."""
+        return (
+            "<SearchStats"
+            " Nodes={nodes}"
+            " Pruned={pruned}"
+            " Candidates={candidates}"
+            " Found={found}"
+            " Finished={finished}"
+            ">".format(
+                nodes=self.nodes,
+                pruned=self.pruned,
+                candidates=self.candidates,
+                found=self.found,
+                finished=self.finished
+            )
+        )
+
+    def visit(self):
+        """Records a visit to a node.
+
+        Returns False if the search should stop instead.
+
+        """
+        if self._is_over_budget():
+            return False
+
+        self.nodes += 1
+        if self.nodes % self.REPORT_INTERVAL == 0:
+            self._check_in()
+        return not self.stopped
+
+    def check_candidate(self):
+        """Records a schedule being checked against the criteria.
+
+        Returns False if the search should stop instead.
+
+        """
+        if self._is_over_budget():
+            return False
+
+        self.candidates += 1
+        if self.candidates % self.REPORT_INTERVAL == 0:
+            self._check_in()
+        return not self.stopped
+
+    def _is_over_budget(self):
+        """Whether the search has stopped or used up its nodes, stopping it
+        if it has."""
+        if (
+            self.max_nodes is not None and
+            self.nodes + self.candidates >= self.max_nodes
+        ):
+            self.stopped = True
+        return self.stopped
+
+    def _check_in(self):
+        """Stops the search if it's out of time, and reports progress."""
+        if self.deadline is not None and time.time() >= self.deadline:
+            self.stopped = True
+        if self.progress:
+            self.progress(self)
+
+    def add(self, other):
+        """Adds the counts from another part of the same search.
+
+        other: The `SearchStats` for the other part of the search.
+
+        """
+        self.nodes += other.nodes
+        self.pruned += other.pruned
+        self.candidates += other.candidates
+        self.stopped = self.stopped or other.stopped or (
+            self.max_nodes is not None and
+            self.nodes + self.candidates >= self.max_nodes
+        ) or (
+            self.deadline is not None and time.time() >= self.deadline
+        )
+        if self.progress:
+            self.progress(self)
+
+
+class ScheduleList(list):
+    """A list of schedules, along with how the search for them went."""
+
+    def __init__(self, schedules, stats):
+        """Constructor.
+
+        schedules: An iterable of schedules.
+        stats: The `SearchStats` for the search.
+
+        """
+        super().__init__(schedules)
+        self.stats = stats
+
+    @property
+    def finished(self):
+        """Whether all of the schedules were found."""
+        return self.stats.finished
+
+
+class SearchSpace:
+    """The choices to be made for a schedule, and which ones go together.
+
+    Choices are identified by integer nodes. This doesn't know anything about
+    sections, so it's cheap to search and to copy around.
+
+    """
+    def __init__(self, domains, compatible):
+        """Constructor.
+
+        domains: A list with a list of nodes for each choice to be made. A
+            solution has one node from each of these lists.
+        compatible: A list with a bitset for each node. Bit `j` of
+            `compatible[i]` is set if nodes `i` and `j` can be in a solution
+            together.
+
+        """
+        self.domains = domains
+        self.compatible = compatible
+
+        # Make the most constrained choices first: those with the fewest
+        # nodes, and then those whose nodes rule out the most other nodes.
+        # They're the most likely to lead to a dead end, so it's best to find
+        # that out close to the root of the search.
+        def constrainedness(i):
+            num_compatible = sum(
+                self._count_bits(self.compatible[j])
+                for j
+                in self.domains[i]
+            )
+            return len(self.domains[i]), num_compatible
+
+        self.order = sorted(range(len(self.domains)), key=constrainedness)
+        """The order in which the choices are made, as indices into
+        `domains`. Solutions list their nodes in this order."""
+
+    @staticmethod
+    def _count_bits(bitset):
+        return bin(bitset).count("1")
+
+    def shards(self):
+        """The nodes which can be made for the first choice, in order.
+
+        Searching each of these with `solutions` and putting the results
+        together gives all of the solutions.
+
+        """
+        # With no choices to make, there's just the one (empty) solution,
+        # which the whole search finds.
+        if not self.domains:
+            return [None]
+        return list(self.domains[self.order[0]])
+
+    def solutions(self, shard=None, prune=None, stats=None, start=None):
+        """Yields each solution as a tuple of nodes, in `order`.
+
+        Every node in a solution is compatible with every other one.
+
+        shard: If given, only yield solutions which use this node for the
+            first choice. See `shards`.
+        prune: If given, a function which is called with the list of nodes
+            chosen so far, in `order`, whenever a node is chosen. If it
+            returns True, no solutions starting with those nodes are yielded.
+        stats: If given, the `SearchStats` to keep track of the search with.
+            The search stops early if it says to, and sets its `stopped_at`.
+        start: If given, a tuple of nodes, in `order`, to carry on an earlier
+            search from. The nodes before the last one are taken as already
+            chosen, and the search starts at the last one, which hasn't been
+            visited yet. If the last one is `None`, the search starts after
+            the ones before it instead, such as after a solution. The same
+            `shard` and `prune` should be given as for the earlier search.
+
+        """
+        if stats is None:
+            stats = SearchStats()
+
+        domains = [self.domains[i] for i in self.order]
+        if shard is not None:
+            domains[0] = [shard]
+        domain_masks = [
+            sum(1 << j for j in i)
             for i
-            in itertools.product(*section_choices)
-            if times_dont_overlap(i)
-            if buildings_arent_too_far_away(i)
-            if are_criteria_met(i)
+            in domains
         ]
+        chosen = [None] * len(domains)
+
+        def search(depth, allowed, start):
+            if start and start[0] is None:
+                return
+
+            if depth == len(domains):
+                yield tuple(chosen)
+                return
+
+            nodes = domains[depth]
+            if start:
+                index = nodes.index(start[0])
+                if len(start) > 1:
+                    # Go back down to where the earlier search stopped. The
+                    # nodes on the way there were already visited.
+                    node = start[0]
+                    chosen[depth] = node
+                    yield from search(
+                        depth + 1,
+                        allowed & self.compatible[node],
+                        start[1:]
+                    )
+                    index += 1
+                nodes = nodes[index:]
+
+            for node in nodes:
+                if not stats.visit():
+                    # Only the deepest search knows where it stopped.
+                    if stats.stopped_at is None:
+                        stats.stopped_at = tuple(chosen[:depth]) + (node,)
+                    return
+
+                if not allowed & (1 << node):
+                    stats.pruned += 1
+                    continue
+
+                # Don't bother going further if this rules out every node for
+                # one of the choices which are still to be made.
+                next_allowed = allowed & self.compatible[node]
+                if not all(
+                    next_allowed & i
+                    for i
+                    in domain_masks[depth + 1:]
+                ):
+                    stats.pruned += 1
+                    continue
+
+                chosen[depth] = node
+                if prune and prune(chosen[:depth + 1]):
+                    stats.pruned += 1
+                    continue
+                yield from search(depth + 1, next_allowed, None)
+
+        return search(0, sum(domain_masks), start)
+
+    def count(self, weights=None):
+        """Counts the solutions without going through each of them.
+
+        Once some of the choices have been made, the number of ways to make
+        the rest only depends on which of their nodes are still allowed, so
+        that's worked out once and remembered.
+
+        weights: If given, a list with a weight for each node. Each solution
+            counts as the product of the weights of its nodes, rather than as
+            one.
+
+        """
+        domains = [self.domains[i] for i in self.order]
+        domain_masks = [
+            sum(1 << j for j in i)
+            for i
+            in domains
+        ]
+
+        # The nodes which could still be chosen at each depth or after it.
+        remaining_masks = [0] * (len(domains) + 1)
+        for depth in reversed(range(len(domains))):
+            remaining_masks[depth] = (
+                remaining_masks[depth + 1] | domain_masks[depth]
+            )
+
+        counts = {}
+
+        def count(depth, allowed):
+            if depth == len(domains):
+                return 1
+
+            key = (depth, allowed & remaining_masks[depth])
+            try:
+                return counts[key]
+            except KeyError:
+                pass
+
+            total = 0
+            for node in domains[depth]:
+                if allowed & (1 << node):
+                    total += (
+                        (weights[node] if weights else 1) *
+                        count(depth + 1, allowed & self.compatible[node])
+                    )
+            counts[key] = total
+            return total
+
+        return count(0, sum(domain_masks))
 
 
 class ScheduleCanvas:
@@ -203,16 +1140,17 @@ class ScheduleCanvas:
             return seconds
 
         for day in section.meeting_time.day_list:
-            height = seconds_to_blocks(umich.MeetingTime.time_difference(
-                time.gmtime(self.START_TIME),
-                section.meeting_time.time_begin
-            ).seconds)
+            height = seconds_to_blocks(
+                section.meeting_time.time_begin * 60 - self.START_TIME
+            )
             top_left = (
                 height,
                 self.column_width * self.DAYS.index(day),
             )
 
-            height = seconds_to_blocks(section.meeting_time.length.seconds)
+            height = seconds_to_blocks(
+                section.meeting_time.length_minutes * 60
+            )
             bottom_right = (
                 top_left[0] + height,
                 top_left[1] + self.column_width,
@@ -1,14 +1,32 @@
 #!/usr/bin/env python3
 import collections
+import concurrent.futures
 import contextlib
 import datetime
+import email.utils
 import functools
 import json
 import logging
+import mmap
 import operator
+import os
 import pickle
+import queue
+import random
+import re
 import requests
+import sqlite3
+import struct
+import sys
+import threading
 import time
+import zlib
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, where cache files aren't locked.
+    fcntl = None
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -24,6 +42,134 @@ EXTRA_ABBREVIATIONS = {
 }
 
 
+class RetryPolicy:
+    """Decides how long to wait before retrying a failed request.
+
+    The wait doubles with each try, up to a maximum, and is randomized a bit
+    so that several clients which failed together don't retry together. If
+    the server said how long to wait, we wait at least that long.
+
+    """
+    def __init__(
+        self,
+        tries=5,
+        base_delay=1,
+        max_delay=60,
+        budget=300
+    ):
+        """Constructor.
+
+        tries: The maximum number of tries to make before giving up.
+        base_delay: The length of time to wait after the first failure, in
+            seconds.
+        max_delay: The most time to wait between two tries, in seconds,
+            unless the server asks for longer.
+        budget: The most time to spend waiting between tries for a single
+            call, in seconds. If the next wait would go over it, we give up
+            instead.
+
+        """
+        self.tries = tries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+
+    def get_delay(self, num_failures, error):
+        """Returns how long to wait before trying again, in seconds.
+
+        num_failures: The number of tries which have failed so far.
+        error: The error from the last try. If it has a `retry_after`
+            attribute which isn't `None`, that's how long the server asked us
+            to wait.
+
+        """
+        backoff = min(
+            self.max_delay,
+            self.base_delay * 2 ** (num_failures - 1)
+        )
+        delay = backoff / 2 + random.uniform(0, backoff / 2)
+
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+
+def _intern(value):
+    """Interns a value if it's a string, so that equal strings share memory.
+
+    value: The value, which might not be a string.
+
+    """
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+@contextlib.contextmanager
+def _lock_file(file_name):
+    """Holds an exclusive lock for a file while in the context.
+
+    The lock is on a separate lock file, since files which are saved by
+    renaming a new file over them are replaced on every save.
+
+    file_name: The name of the file to lock.
+
+    """
+    with open(file_name + ".lock", "a") as lock_file:
+        if fcntl:
+            # Released when the file is closed.
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        yield
+
+
+class FreshnessPolicy:
+    """Decides how long cached responses can be used for.
+
+    Each URL gets a time to live (TTL), which is how long its response is
+    fresh for after it's fetched. Once it's stale, it's fetched again; if the
+    server says it hasn't changed, only the time it was fetched is updated.
+
+    """
+    def __init__(self, ttls=(), serve_stale=True):
+        """Constructor.
+
+        ttls: A list of tuples of a regular expression and a TTL in seconds.
+            The TTL for a URL is the one for the first expression which
+            matches the start of it. A TTL of `None` means the response never
+            goes stale, which is also the case for URLs which don't match.
+        serve_stale: Whether a stale response should be used while it's being
+            fetched again in the background. If not, callers wait for the new
+            response instead.
+
+        """
+        self.ttls = [
+            (re.compile(pattern), ttl)
+            for pattern, ttl
+            in ttls
+        ]
+        self.serve_stale = serve_stale
+
+    def get_ttl(self, url):
+        """Returns the TTL for a URL in seconds, or `None` if it has none.
+
+        url: The relative URL, like "/Terms".
+
+        """
+        for pattern, ttl in self.ttls:
+            if pattern.match(url):
+                return ttl
+        return None
+
+    def is_fresh(self, url, fetched_at):
+        """Whether a response fetched at the given time is still fresh.
+
+        url: The relative URL, like "/Terms".
+        fetched_at: The time the response was fetched at, as a timestamp.
+
+        """
+        ttl = self.get_ttl(url)
+        return ttl is None or time.time() < fetched_at + ttl
+
+
 class retry(object):
     """Handles retrying the request.
 
@@ -31,17 +177,15 @@ class retry(object):
     the event of a failure, we sleep for a while and try again.
 
     """
-    def __init__(self, tries, wait_time, caught_errors):
+    def __init__(self, policy, caught_errors):
         """Constructor.
 
-        tries: The maximum number of tries to make before giving up.
-            When giving up, the received error is rethrown.
-        wait_time: The length of time to wait, in seconds.
+        policy: The `RetryPolicy` saying how many times to try and how long
+            to wait. When giving up, the received error is rethrown.
         caught_errors: A tuple of errors which are allowed to be caught.
 
         """
-        self.tries = tries
-        self.wait_time = wait_time
+        self.policy = policy
         self.caught_errors = caught_errors
 
     def __call__(self, func):
@@ -52,17 +196,21 @@ class retry(object):
         """
         @functools.wraps(func)
         def wrapped(*args, **kwargs):
-            remaining_tries = self.tries
+            num_failures = 0
+            time_waited = 0
             while True:
                 try:
                     # Try once more.
-                    ret = func()
+                    ret = func(*args, **kwargs)
 
                     # If we got here, we succeeded! Return as usual.
                     return ret
                 except self.caught_errors as e:
                     # If we got here, there was an error which we're supposed
                     # to catch.
+                    num_failures += 1
+                    delay = self.policy.get_delay(num_failures, e)
+                    remaining_tries = self.policy.tries - num_failures
 
                     logging.info(
                         "Function '{func}' failed with {error}: '{message}'. "
@@ -74,14 +222,17 @@ class retry(object):
                         )
                     )
 
-                    # Propagate the error if we're out of tries.
-                    if remaining_tries <= 0:
+                    # Propagate the error if we're out of tries, or if
+                    # waiting would take too long.
+                    if (
+                        remaining_tries <= 0 or
+                        time_waited + delay > self.policy.budget
+                    ):
                         raise e
-                    else:
-                        remaining_tries -= 1
 
                     # Otherwise, sleep and try again.
-                    time.sleep(self.wait_time)
+                    time.sleep(delay)
+                    time_waited += delay
         return wrapped
 
 
@@ -96,10 +247,30 @@ class BaseAPI:
         """Generic API error."""
         pass
 
+    class TransientError(APIError):
+        """An error which might go away if the request is made again.
+
+        This is for rate limiting and server errors.
+
+        """
+        def __init__(self, message, retry_after=None):
+            """Constructor.
+
+            message: The error message.
+            retry_after: How long the server asked us to wait before trying
+                again, in seconds, or `None` if it didn't say.
+
+            """
+            super().__init__(message)
+            self.retry_after = retry_after
+
     class RateLimiter:
         """Limits the rate at which some arbitrary requests are made.
 
-        Not at all thread-safe.
+        This is a sliding window: it remembers when the last
+        `REQUESTS_PER_TIME` requests were made, and the next request can be
+        made `TIME_SPAN` seconds after the oldest of them. It's thread-safe,
+        and requests are let through in the order they asked.
 
         """
         REQUESTS_PER_TIME = 59
@@ -108,9 +279,36 @@ class BaseAPI:
         TIME_SPAN = 60
         """The number of seconds in the time span (which is a minute)."""
 
+        _shared = {}
+        _shared_lock = threading.Lock()
+
         def __init__(self):
             """Constructor."""
-            self.request_times = []
+            # The times the most recent requests were (or will be) made, in
+            # order. Once it's full, the oldest time falls off the left as a
+            # new one is added.
+            self.request_times = collections.deque(
+                maxlen=self.REQUESTS_PER_TIME
+            )
+            self.lock = threading.Lock()
+
+        @classmethod
+        def shared(cls, key):
+            """Returns the rate limiter shared by everything using `key`.
+
+            The rate limit applies to an access key, so APIs using the same
+            access key should share a rate limiter.
+
+            key: The key to share the rate limiter by, like the access key.
+
+            """
+            with cls._shared_lock:
+                try:
+                    return cls._shared[key]
+                except KeyError:
+                    rate_limiter = cls()
+                    cls._shared[key] = rate_limiter
+                    return rate_limiter
 
         def time_until_next_request(self):
             """Returns the time in seconds until you can make another request.
@@ -120,48 +318,72 @@ class BaseAPI:
             try again. Returns a float of the number of seconds to wait.
 
             """
-            self._drop_old_requests()
-            if len(self.request_times) < self.REQUESTS_PER_TIME:
-                return float(0)
-            else:
-                # The next request can be made after one request leaves the
-                # pool, which is 60 seconds after it's happened.
-                next_request_time = sorted(
-                    self.request_times
-                )[0] + self.REQUESTS_PER_TIME
-
-                # Then get the delta.
-                return max(0, next_request_time - time.time())
+            with self.lock:
+                return max(0.0, self._next_request_time() - time.monotonic())
 
         def request_made(self):
             """Inform the rate limiter that a request was just made."""
-            self.request_times.append(time.time())
-            self._drop_old_requests()
+            with self.lock:
+                self.request_times.append(time.monotonic())
+
+        def acquire(self):
+            """Waits until a request can be made, and counts it as made.
+
+            The request's place is reserved before waiting, so waiting threads
+            don't need to hold any locks and can't take each other's turns.
+
+            """
+            with self.lock:
+                now = time.monotonic()
+                request_time = max(now, self._next_request_time())
+                self.request_times.append(request_time)
 
             logging.info(
-                "Request made at time {time}. "
-                "Recent requests: {num_requests}. "
-                "Time until next request: {next_request_time}".format(
-                    time=time.time(),
-                    num_requests=len(self.request_times),
-                    next_request_time=self.time_until_next_request()
+                "Request scheduled in {delay:.2f} seconds.".format(
+                    delay=request_time - now
                 )
             )
+            if request_time > now:
+                time.sleep(request_time - now)
 
-        def _drop_old_requests(self):
-            """Forget about requests made a long time ago."""
-            self.request_times = [
-                i
-                for i
-                in self.request_times
-                if i >= time.time() - self.TIME_SPAN
-            ]
+        def _next_request_time(self):
+            """The earliest time the next request can be made at.
+
+            The lock must be held.
 
-    def __init__(self, access_key, cache=None):
+            """
+            if len(self.request_times) < self.REQUESTS_PER_TIME:
+                return float("-inf")
+
+            # The next request can be made after the oldest request leaves
+            # the window.
+            return self.request_times[0] + self.TIME_SPAN
+
+    MAX_CONCURRENT_REQUESTS = 8
+    """The most requests `make_requests` will have in flight at once."""
+
+    TTLS = []
+    """The default TTLs for the API's URLs. See `FreshnessPolicy`."""
+
+    def __init__(
+        self,
+        access_key,
+        cache=None,
+        rate_limiter=None,
+        retry_policy=None,
+        freshness_policy=None
+    ):
         """Constructor.
 
         access_key: The access token to use for the API. Something like
             "Bearer abcdef1234567890...".
+        cache: A dict-like object to cache responses in.
+        rate_limiter: The `RateLimiter` to use. By default, the API gets its
+            own. Pass `RateLimiter.shared(access_key)` to share one with the
+            other APIs using the same access key.
+        retry_policy: The `RetryPolicy` for failed requests.
+        freshness_policy: The `FreshnessPolicy` for cached responses. By
+            default, it uses `TTLS`.
 
         """
         # Set up the session to authenticate for the API automatically.
@@ -171,56 +393,433 @@ class BaseAPI:
             "Accept": "application/json",
         })
 
-        self.rate_limiter = self.RateLimiter()
+        self.rate_limiter = rate_limiter or self.RateLimiter()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.freshness_policy = (
+            freshness_policy or FreshnessPolicy(self.TTLS)
+        )
 
-        self.cache = cache or {}
+        # Made the first time it's needed by `make_requests`.
+        self.executor = None
+        self.executor_lock = threading.Lock()
+
+        # Stale responses are fetched again on their own thread, so they
+        # don't hold up anything else. The queue and the thread are made the
+        # first time they're needed.
+        self.refresh_queue = None
+        self.refreshing = set()
+
+        self.cache = cache if cache is not None else {}
+
+        # The requests which are being made right now, keyed by cache key, so
+        # that anyone else asking for the same thing can wait for the result
+        # instead of making the request again.
+        self.in_flight = {}
+        self.in_flight_lock = threading.Lock()
+
+        # The number of requests which have finished. The cache is read
+        # without holding the in-flight lock, so this tells whether a request
+        # might have finished and filled in the cache in the meantime.
+        self.num_finished = 0
+
+        self.request_stats = collections.Counter()
+        """Counts of how requests were answered: "requests" for those which
+        went to the network, "cache_hits" for those answered by the cache,
+        "stale_hits" for those answered by a stale response from the cache,
+        and "coalesced" for those which waited on an identical request which
+        was already in flight. "refreshes" counts the requests made in the
+        background to replace stale responses, and "not_modified" counts the
+        requests which found that the cached response hadn't changed."""
 
     def make_request(self, url):
         """Makes a request and parses its result as JSON.
 
-        Returns the JSON content of the request.
+        Returns the JSON content of the request. If the same request is
+        already being made by another thread, waits for it and returns its
+        result instead.
 
         url: The relative URL to request, like "/Terms".
 
         """
-
         cache_key = url
+        is_making_request = False
+        while True:
+            with self.in_flight_lock:
+                future = self.in_flight.get(cache_key)
+                num_finished = self.num_finished
+            if future:
+                break
+
+            # Reading the cache can mean going to disk, so it's done without
+            # the lock, so that other threads aren't held up.
+            entry = self._get_cache_entry(cache_key)
+            if entry:
+                if self.freshness_policy.is_fresh(url, entry["fetched_at"]):
+                    with self.in_flight_lock:
+                        self.request_stats["cache_hits"] += 1
+                    return entry["response"]
+                elif self.freshness_policy.serve_stale:
+                    with self.in_flight_lock:
+                        self.request_stats["stale_hits"] += 1
+                        self._start_refresh(url, entry)
+                    return entry["response"]
+
+            with self.in_flight_lock:
+                future = self.in_flight.get(cache_key)
+                if future:
+                    break
+
+                # If a request finished while we were reading the cache, it
+                # might have been this one, so look in the cache again.
+                if self.num_finished != num_finished:
+                    continue
+
+                future = concurrent.futures.Future()
+                self.in_flight[cache_key] = future
+                self.request_stats["requests"] += 1
+                is_making_request = True
+                break
+
+        if not is_making_request:
+            with self.in_flight_lock:
+                self.request_stats["coalesced"] += 1
+            return future.result()
+
+        try:
+            ret = self._fetch(url, entry)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(ret)
+            return ret
+        finally:
+            with self.in_flight_lock:
+                del self.in_flight[cache_key]
+                self.num_finished += 1
+
+    def _get_cache_entry(self, cache_key):
+        """Returns the cache entry for a key, or `None` if there isn't one.
+
+        Entries are dicts with the "response", the time it was "fetched_at",
+        and its "etag" and "last_modified" headers, if it had them.
+
+        cache_key: The cache key.
+
+        """
         try:
-            return self.cache[cache_key]
+            entry = self.cache[cache_key]
         except KeyError:
-            pass
+            return None
+
+        if isinstance(entry, dict) and "fetched_at" in entry:
+            return entry
+
+        # This response was cached before we kept track of when responses
+        # were fetched. We can't tell how old it is, so start counting from
+        # now, rather than fetching everything again at once.
+        entry = {
+            "response": entry,
+            "fetched_at": time.time(),
+            "etag": None,
+            "last_modified": None,
+        }
+        self.cache[cache_key] = entry
+        return entry
+
+    def _fetch(self, url, entry):
+        """Fetches a URL from the API and caches the response.
 
-        @retry(tries=2, wait_time=60, caught_errors=(ValueError,))
+        Returns the JSON content of the response.
+
+        url: The relative URL to request, like "/Terms".
+        entry: The cache entry for the URL, or `None` if there isn't one. If
+            there is, the server is asked to only send the response if it's
+            changed.
+
+        """
+        headers = {}
+        if entry and entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+        @retry(self.retry_policy, caught_errors=(
+            self.TransientError,
+            requests.ConnectionError,
+            requests.Timeout,
+            ValueError,
+        ))
         def try_request():
-            self._sleep_until_next_request()
-            self.rate_limiter.request_made()
-            text = self.session.get(self.URL + url).text
-            return json.loads(text)
+            self.rate_limiter.acquire()
+            response = self.session.get(self.URL + url, headers=headers)
+            self._check_status(url, response)
+            if response.status_code == 304:
+                return response, None
+            return response, json.loads(response.text)
 
         try:
-            ret = try_request()
-            self.cache[cache_key] = ret
-            return ret
+            response, ret = try_request()
         except ValueError as e:
             raise self.APIError("Could not authenticate.") from e
 
-    def _sleep_until_next_request(self):
-        """Sleep until we're allowed to make another request."""
-        time_to_wait = self.rate_limiter.time_until_next_request()
-        while time_to_wait:
-            time.sleep(time_to_wait)
-            time_to_wait = self.rate_limiter.time_until_next_request()
+        if response.status_code == 304:
+            self.request_stats["not_modified"] += 1
+            ret = entry["response"]
+
+        self.cache[url] = {
+            "response": ret,
+            "fetched_at": time.time(),
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+        return ret
+
+    def _start_refresh(self, url, entry):
+        """Starts fetching a stale response again in the background.
+
+        Does nothing if it's already being fetched. The in-flight lock must be
+        held.
+
+        url: The relative URL, like "/Terms".
+        entry: The stale cache entry for the URL.
+
+        """
+        if url in self.refreshing:
+            return
+
+        # The thread is a daemon, so that a refresh which is stuck retrying
+        # doesn't keep the program from exiting.
+        if not self.refresh_queue:
+            self.refresh_queue = queue.Queue()
+            threading.Thread(
+                target=self._refresh_responses,
+                args=(self.refresh_queue,),
+                daemon=True
+            ).start()
+
+        self.request_stats["refreshes"] += 1
+        self.refreshing.add(url)
+        self.refresh_queue.put((url, entry))
+
+    def _refresh_responses(self, refresh_queue):
+        """Fetches stale responses from the queue until it gets `None`.
+
+        refresh_queue: The queue of URLs and their stale cache entries.
+
+        """
+        while True:
+            item = refresh_queue.get()
+            if item is None:
+                refresh_queue.task_done()
+                return
+
+            url, entry = item
+            try:
+                self._fetch(url, entry)
+            except Exception as e:
+                logger.warning(
+                    "Could not refresh '{url}': {error}".format(
+                        url=url,
+                        error=e
+                    )
+                )
+            finally:
+                with self.in_flight_lock:
+                    self.refreshing.discard(url)
+                refresh_queue.task_done()
+
+    def close(self):
+        """Stops fetching stale responses in the background.
+
+        Refreshes which haven't started yet are dropped, and the one which
+        has is waited for, so that its response makes it into the cache. Call
+        this before saving the cache.
+
+        """
+        with self.in_flight_lock:
+            refresh_queue = self.refresh_queue
+            self.refresh_queue = None
+            if not refresh_queue:
+                return
+
+            while True:
+                try:
+                    url, entry = refresh_queue.get_nowait()
+                except queue.Empty:
+                    break
+                self.refreshing.discard(url)
+                refresh_queue.task_done()
+            refresh_queue.put(None)
+
+        refresh_queue.join()
+
+    def _check_status(self, url, response):
+        """Raises an error if the response's status code says it failed.
+
+        url: The relative URL which was requested.
+        response: The `requests.Response`.
+
+        """
+        status_code = response.status_code
+        if status_code == 429 or status_code >= 500:
+            raise self.TransientError(
+                "Request for '{url}' failed with status {status_code}.".format(
+                    url=url,
+                    status_code=status_code
+                ),
+                retry_after=self._get_retry_after(response)
+            )
+        elif status_code in (401, 403):
+            raise self.APIError("Could not authenticate.")
+        elif status_code >= 400:
+            raise self.APIError(
+                "Request for '{url}' failed with status {status_code}.".format(
+                    url=url,
+                    status_code=status_code
+                )
+            )
+
+    @staticmethod
+    def _get_retry_after(response):
+        """Returns how long the response asks us to wait, in seconds.
+
+        Returns `None` if it doesn't say.
+
+        response: The `requests.Response`.
+
+        """
+        retry_after = response.headers.get("Retry-After")
+        if retry_after is None:
+            return None
+
+        # It's either a number of seconds or an HTTP date.
+        try:
+            return max(0, float(retry_after))
+        except ValueError:
+            pass
+        try:
+            retry_time = email.utils.parsedate_to_datetime(retry_after)
+        except (TypeError, ValueError):
+            return None
+        return max(0, retry_time.timestamp() - time.time())
+
+    def make_requests(self, urls):
+        """Makes several requests at once and parses their results as JSON.
+
+        Up to `MAX_CONCURRENT_REQUESTS` requests are made at the same time,
+        and they all share the rate limit. Returns a list of the JSON content
+        of each request, in the same order as the URLs.
+
+        urls: The relative URLs to request.
+
+        """
+        with self.executor_lock:
+            if not self.executor:
+                self.executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.MAX_CONCURRENT_REQUESTS
+                )
+        return list(self.executor.map(self.make_request, urls))
 
 
 class ClassAPI(BaseAPI):
     URL = "http://api-gw.it.umich.edu/Curriculum/SOC/v1"
     """The API url for the class scheduling info."""
 
+    TTLS = [
+        # Sections and their enrollment change all the time.
+        (r"/Terms/[^/]+/Classes/", 60 * 60),
+        (r"/Terms$", 24 * 60 * 60),
+    ]
+
+    def __init__(self, *args, **kwargs):
+        """Constructor.
+
+        Takes the same arguments as `BaseAPI`.
+
+        """
+        super().__init__(*args, **kwargs)
+        self.term_index = None
+        self.term_index_lock = threading.Lock()
+
+        # The `Catalog`s to read sections from, keyed by term code.
+        self.catalogs = {}
+
+    def add_catalog(self, catalog):
+        """Read sections from a catalog instead of fetching them.
+
+        Sections in subjects which aren't in the catalog are still fetched.
+
+        catalog: The `Catalog`, made by `Term.prefetch_catalog`.
+
+        """
+        self.catalogs[catalog.term_code] = catalog
+
+    def get_term_index(self, refresh=False):
+        """Returns the `TermIndex` of all the terms.
+
+        It's made the first time it's asked for, and made again if it's
+        refreshed and the list of terms has changed since.
+
+        refresh: Whether to get the list of terms again, such as when a term
+            couldn't be found in it.
+
+        """
+        with self.term_index_lock:
+            if self.term_index and not refresh:
+                return self.term_index
+
+            if not self.term_index and not refresh and self.catalogs:
+                # Start with just the catalogs' terms, so that they can be used
+                # without asking for the list of terms. Other terms will be
+                # missing, so it will be refreshed if they're asked for.
+                self.term_index = TermIndex(self, {
+                    "getSOCTermsResponse": {
+                        "Term": [
+                            i.term_info
+                            for i
+                            in self.catalogs.values()
+                        ],
+                    },
+                })
+                return self.term_index
+
+            terms = self.make_request("/Terms")
+            if not self.term_index or terms != self.term_index.terms:
+                self.term_index = TermIndex(self, terms)
+            return self.term_index
+
 
 class BuildingAPI(BaseAPI):
     URL = "http://api-gw.it.umich.edu/Facilities/Buildings/v1"
     """The API url for the building info."""
 
+    TTLS = [
+        (r"/Buildings", 30 * 24 * 60 * 60),
+        (r"/Campuses", 30 * 24 * 60 * 60),
+    ]
+
+    def __init__(self, *args, **kwargs):
+        """Constructor.
+
+        Takes the same arguments as `BaseAPI`.
+
+        """
+        super().__init__(*args, **kwargs)
+        self.building_index = None
+        self.building_index_lock = threading.Lock()
+
+    def get_building_index(self):
+        """Returns the `BuildingIndex` of all the buildings.
+
+        It's only made the first time it's asked for.
+
+        """
+        with self.building_index_lock:
+            if not self.building_index:
+                self.building_index = BuildingIndex(self)
+            return self.building_index
+
 
 class Building:
     def __init__(self, info):
@@ -261,11 +860,72 @@ class Building:
         section: The class section.
 
         """
-        campuses = building_api.make_request("/Campuses")
+        return building_api.get_building_index().get_building(section)
 
-        section_location = section._get_meeting()["Location"]
-        section_building = section_location.split()[-1]
 
+class BuildingIndex:
+    """Finds the buildings which sections take place in.
+
+    The buildings are fetched once and kept by abbreviation. The building for
+    each location, and for each section, is remembered once it's been found.
+
+    """
+    def __init__(self, building_api):
+        """Constructor.
+
+        building_api: The building API.
+
+        """
+        # The buildings keyed by abbreviation, and by the other names which
+        # sections' locations use for them.
+        self.buildings = {}
+        for i in building_api.make_request("/Buildings")["Buildings"][
+            "Building"
+        ]:
+            self.buildings.setdefault(i["Abbreviation"], Building(i))
+        for location_name, abbreviation in EXTRA_ABBREVIATIONS.items():
+            if abbreviation in self.buildings:
+                self.buildings.setdefault(
+                    location_name,
+                    self.buildings[abbreviation]
+                )
+
+        # The building for each location which has been looked up, keyed by
+        # the location.
+        self.locations = {}
+
+    def get_building(self, section):
+        """Returns the building where a section is taking place.
+
+        If the section doesn't have a location decided, returns `None`.
+
+        section: The class section.
+
+        """
+        try:
+            return section._building
+        except AttributeError:
+            pass
+
+        section_location = section.location
+        try:
+            building = self.locations[section_location]
+        except KeyError:
+            building = self._find_building(section)
+            self.locations[section_location] = building
+        section._building = building
+        return building
+
+    def _find_building(self, section):
+        """Finds the building where a section is taking place.
+
+        If the section doesn't have a location decided, returns `None`.
+
+        section: The class section.
+
+        """
+        section_location = section.location
+        section_building = section_location.split()[-1]
         if section_building in ["ARR", "TBA"]:
             return None
 
@@ -277,28 +937,16 @@ class Building:
         if section_building == "BUS":
             return None
 
-        # Go through each campus and see if it has the given building.
-        for i in campuses["Campuses"]["Campus"]:
-            buildings = building_api.make_request(
-                "/Buildings"
-            )["Buildings"]["Building"]
-            for j in buildings:
-                if j["Abbreviation"] == section_building:
-                    return Building(j)
-
-                if (
-                    section_building in EXTRA_ABBREVIATIONS and
-                    j["Abbreviation"] == EXTRA_ABBREVIATIONS[section_building]
-                ):
-                    return Building(j)
-
-        raise RuntimeError(
-            "Could not find building for section {section}, "
-            "which is in building {building}.".format(
-                section=section,
-                building=section_building
+        try:
+            return self.buildings[section_building]
+        except KeyError:
+            raise RuntimeError(
+                "Could not find building for section {section}, "
+                "which is in building {building}.".format(
+                    section=section,
+                    building=section_building
+                )
             )
-        )
 
 
 class Term:
@@ -310,6 +958,7 @@ class Term:
 
         """
         self.class_api = class_api
+        self.info = term_info
 
         self.code = term_info["TermCode"]
         self.short_name = term_info["TermShortDescr"]
@@ -325,82 +974,342 @@ class Term:
     def get_section_group(self, class_code):
         """Gets a `SectionGroup` from its code for the semester.
 
+        If the class API has a catalog with the class's subject, the sections
+        are read from it instead of being fetched.
+
         class_code: A class code, like "EECS 280".
 
         """
-        def get_all_class_numbers():
-            info = self.class_api.make_request(
-                "/Terms/{TermCode}/Classes/Search/{SearchCriteria}".format(
-                    TermCode=self.code,
-                    SearchCriteria=class_code
-                )
+        catalog = self.class_api.catalogs.get(self.code)
+        if catalog and catalog.has_subject(class_code.split()[0]):
+            catalog.record_query(class_code)
+            class_numbers = catalog.get_class_numbers(class_code)
+        else:
+            class_numbers = self.search_class_numbers(class_code)
+
+        sections = Section.from_class_numbers(
+            self.class_api,
+            self,
+            class_numbers
+        )
+        return SectionGroup([
+            i
+            for i
+            in sections
+            if i.code == class_code
+        ])
+
+    def search_class_numbers(self, search_criteria):
+        """Returns the class numbers of the sections which match a search.
+
+        search_criteria: What to search for, like "EECS 280" for the sections
+            of a class, or "EECS" for all of the sections in a subject.
+
+        """
+        info = self.class_api.make_request(
+            "/Terms/{TermCode}/Classes/Search/{SearchCriteria}".format(
+                TermCode=self.code,
+                SearchCriteria=search_criteria
             )
-            # They return a list if there are multiple results, but a dict (of
-            # the result) if there is only one result.
-            search_results = info["searchSOCClassesResponse"]["SearchResult"]
-            if isinstance(search_results, dict):
-                search_results = [search_results]
-            for i in search_results:
-                yield i["ClassNumber"]
+        )
+        # They return a list if there are multiple results, but a dict (of
+        # the result) if there is only one result.
+        search_results = info["searchSOCClassesResponse"]["SearchResult"]
+        if isinstance(search_results, dict):
+            search_results = [search_results]
+        return [
+            i["ClassNumber"]
+            for i
+            in search_results
+        ]
 
-        sections = []
-        for i in get_all_class_numbers():
-            section = Section.from_class_number(self.class_api, self, i)
-            if section.code == class_code:
-                sections.append(Section.from_class_number(
-                    self.class_api,
-                    self,
-                    i
-                ))
-        return SectionGroup(sections)
+    def prefetch_catalog(self, catalog, subjects, batch_size=100):
+        """Fetches all of the sections in some subjects into a catalog.
 
-    @classmethod
-    def from_season(cls, class_api, season):
-        """Makes a Term corresponding to a given season.
+        The catalog is saved after each batch of sections, so if this is
+        stopped, calling it again with the same catalog carries on where it
+        left off.
 
-        class_api: The ClassAPI instance.
-        season: The season code, such as "FA 2014" or "SS 2014".
+        catalog: The `Catalog` to fill in. It must be empty or be for this
+            term.
+        subjects: The subject codes, like "EECS".
+        batch_size: How many sections to fetch between saves.
 
         """
-        terms = class_api.make_request("/Terms")
-        term_info = terms["getSOCTermsResponse"]["Term"]
+        self._check_catalog_term(catalog)
+        for subject in subjects:
+            if subject not in catalog.subjects:
+                catalog.add_subject(
+                    subject,
+                    self.search_class_numbers(subject)
+                )
+                catalog.save()
 
-        # If there's only one term, it looks like it will return only a single
-        # value instead of a list of values.
-        if isinstance(term_info, list):
-            term = next(
-                i
+            self._fetch_catalog_sections(
+                catalog,
+                [
+                    i
+                    for i
+                    in catalog.subjects[subject]
+                    if catalog.get_section_info(i) is None
+                ],
+                batch_size
+            )
+
+    def sync_catalog(
+        self,
+        catalog,
+        subjects,
+        max_age,
+        limit=None,
+        batch_size=100
+    ):
+        """Brings the sections in some subjects in a catalog up to date.
+
+        The subjects are searched again, and sections which have been added
+        are fetched, and ones which have been removed are dropped. Of the rest,
+        only those which were fetched too long ago are fetched again. Sections
+        of the classes which have been looked up in the catalog the most are
+        fetched first, and then the oldest.
+
+        Returns a list of `CatalogChange`s for the sections which were added
+        or removed, or whose meeting times or locations changed. Sections
+        which were listed in the catalog but never fetched, such as after
+        `prefetch_catalog` was stopped, aren't counted as added, or as
+        removed if they're gone.
+
+        The sections are fetched through the class API, so it shouldn't have
+        a cache which might give back old responses. Like
+        `prefetch_catalog`, the catalog is saved after each batch.
+
+        catalog: The `Catalog` to update. It must be empty or be for this
+            term.
+        subjects: The subject codes, like "EECS".
+        max_age: How long ago a section can have been fetched before it's
+            fetched again, in seconds.
+        limit: The most sections to fetch again because they're too old, or
+            `None` for no limit. New sections are always fetched.
+        batch_size: How many sections to fetch between saves.
+
+        """
+        self._check_catalog_term(catalog)
+
+        changes = []
+        new_class_numbers = []
+        added_class_numbers = set()
+        for subject in subjects:
+            is_new_subject = subject not in catalog.subjects
+            old_class_numbers = catalog.subjects.get(subject, [])
+            class_numbers = self.search_class_numbers(subject)
+            catalog.add_subject(subject, class_numbers)
+
+            current_class_numbers = set(
+                str(i)
                 for i
-                in terms["getSOCTermsResponse"]["Term"]
-                if i["TermShortDescr"] == season
+                in class_numbers
             )
-        else:
-            term = term_info
+            listed_class_numbers = set(
+                str(i)
+                for i
+                in old_class_numbers
+            )
+            for i in old_class_numbers:
+                old_info = catalog.get_section_info(i)
+                if str(i) not in current_class_numbers and old_info:
+                    changes.append(CatalogChange(i, old_info, None))
+                    catalog.remove_section(i)
+
+            for i in class_numbers:
+                if catalog.get_section_info(i) is None:
+                    new_class_numbers.append(i)
+                    if (
+                        not is_new_subject and
+                        str(i) not in listed_class_numbers
+                    ):
+                        added_class_numbers.add(i)
+        catalog.save()
+
+        old_enough_time = time.time() - max_age
+        stale_class_numbers = sorted(
+            set(
+                str(i)
+                for subject in subjects
+                for i in catalog.subjects[subject]
+                if catalog.get_fetched_at(i) is not None and
+                catalog.get_fetched_at(i) < old_enough_time
+            ),
+            key=lambda i: (
+                -catalog.queries[
+                    Section._get_code(catalog.get_section_info(i))
+                ],
+                catalog.get_fetched_at(i),
+            )
+        )
+        if limit is not None:
+            stale_class_numbers = stale_class_numbers[:limit]
 
-        return cls(class_api, term)
+        for class_number, old_info, new_info in self._fetch_catalog_sections(
+            catalog,
+            new_class_numbers + stale_class_numbers,
+            batch_size
+        ):
+            change = CatalogChange(class_number, old_info, new_info)
+            if class_number in added_class_numbers or change.is_moved():
+                changes.append(change)
+        return changes
 
-    @classmethod
-    def from_term_code(cls, class_api, term_code):
-        """Makes a Term corresponding to the given term code.
+    def _check_catalog_term(self, catalog):
+        """Makes sure a catalog is for this term, or makes it for this term if
+        it's empty.
 
-        class_api: The ClassAPI instance.
-        term_code: The term code.
+        catalog: The `Catalog`.
 
         """
-        terms = class_api.make_request("/Terms")
-        return cls(class_api, next(
-            i
-            for i
-            in terms["getSOCTermsResponse"]["Term"]
-            if i["TermCode"] == term_code
-        ))
+        if catalog.term_info is None:
+            catalog.term_info = self.info
+        elif catalog.term_code != self.code:
+            raise RuntimeError(
+                "Catalog {file_name} is for term {catalog_term}, not "
+                "{term}.".format(
+                    file_name=catalog.file_name,
+                    catalog_term=catalog.term_code,
+                    term=self.code
+                )
+            )
 
-    @classmethod
-    def from_section(cls, class_api, section):
-        return Term.from_term_code(class_api, section.info["TermCode"])
+    def _fetch_catalog_sections(self, catalog, class_numbers, batch_size):
+        """Fetches sections into a catalog, saving it after each batch.
 
+        Returns a list of tuples of each section's class number, its old
+        information in the catalog (or `None`), and its new information.
 
-class SectionGroup:
+        catalog: The `Catalog`.
+        class_numbers: The class numbers of the sections.
+        batch_size: How many sections to fetch between saves.
+
+        """
+        ret = []
+        for start in range(0, len(class_numbers), batch_size):
+            batch = class_numbers[start:start + batch_size]
+            infos = self.class_api.make_requests([
+                Section._get_url(self.code, i)
+                for i
+                in batch
+            ])
+            for class_number, info in zip(batch, infos):
+                info = info["getSOCSectionListByNbrResponse"]["ClassOffered"]
+                ret.append((
+                    class_number,
+                    catalog.get_section_info(class_number),
+                    info
+                ))
+                catalog.add_section(class_number, info)
+            catalog.save()
+
+            logging.info(
+                "Fetched {num_fetched} of {num_sections} sections.".format(
+                    num_fetched=start + len(batch),
+                    num_sections=len(class_numbers)
+                )
+            )
+        return ret
+
+    @classmethod
+    def from_season(cls, class_api, season):
+        """Returns the Term corresponding to a given season.
+
+        class_api: The ClassAPI instance.
+        season: The season code, such as "FA 2014" or "SS 2014".
+
+        """
+        try:
+            return class_api.get_term_index().get_by_season(season)
+        except KeyError:
+            # It might have been added since we got the list of terms.
+            return class_api.get_term_index(refresh=True).get_by_season(
+                season
+            )
+
+    @classmethod
+    def from_term_code(cls, class_api, term_code):
+        """Returns the Term corresponding to the given term code.
+
+        class_api: The ClassAPI instance.
+        term_code: The term code.
+
+        """
+        try:
+            return class_api.get_term_index().get_by_code(term_code)
+        except KeyError:
+            # It might have been added since we got the list of terms.
+            return class_api.get_term_index(refresh=True).get_by_code(
+                term_code
+            )
+
+    @classmethod
+    def from_section(cls, class_api, section):
+        return Term.from_term_code(class_api, section.term_code)
+
+
+class TermIndex:
+    """All of the terms, kept by season and by term code.
+
+    The same `Term` is returned each time a term is looked up.
+
+    """
+    def __init__(self, class_api, terms):
+        """Constructor.
+
+        class_api: The ClassAPI instance.
+        terms: The response to the "/Terms" request.
+
+        """
+        self.terms = terms
+
+        # If there's only one term, it looks like it will return only a single
+        # value instead of a list of values.
+        term_info = terms["getSOCTermsResponse"]["Term"]
+        is_only_term = isinstance(term_info, dict)
+        if is_only_term:
+            term_info = [term_info]
+
+        self.term_list = [
+            Term(class_api, i)
+            for i
+            in term_info
+        ]
+        self.only_term = self.term_list[0] if is_only_term else None
+        self.terms_by_season = {}
+        self.terms_by_code = {}
+        for i in self.term_list:
+            self.terms_by_season.setdefault(i.short_name, i)
+            self.terms_by_code.setdefault(i.code, i)
+
+    def get_by_season(self, season):
+        """Returns the Term corresponding to a given season.
+
+        Raises `KeyError` if there isn't one.
+
+        season: The season code, such as "FA 2014" or "SS 2014".
+
+        """
+        # If there's only one term, it's always the one that's meant.
+        if self.only_term:
+            return self.only_term
+        return self.terms_by_season[season]
+
+    def get_by_code(self, term_code):
+        """Returns the Term corresponding to the given term code.
+
+        Raises `KeyError` if there isn't one.
+
+        term_code: The term code.
+
+        """
+        return self.terms_by_code[term_code]
+
+
+class SectionGroup:
     """A class for a given term, with all of its sections."""
     def __init__(self, section_list):
         """Constructor.
@@ -444,23 +1353,42 @@ class MeetingTime:
     this should be rare.
 
     """
+    DAYS = ["Mo", "Tu", "We", "Th", "Fr", "Sa", "Su"]
+    """The days of the week, in the order they appear in the week mask."""
+
+    MINUTES_PER_DAY = 24 * 60
+    """The number of bits for each day in the week mask."""
+
     def __init__(self, day_list, time_begin, time_end):
         """Constructor.
 
         day_list: The list of days the section meets on, like ["Mo", "We"].
-        time_begin: The time the section begins, like datetime.time(10, 00).
-        time_end: The time the section ends, like datetime.time(12, 00).
+        time_begin: The time the section begins, in minutes since midnight,
+            like 600 for 10:00 AM. A `datetime.time` or `time.struct_time`
+            works too.
+        time_end: The time the section ends, like `time_begin`.
 
         """
         self.day_list = day_list
-        self.time_begin = time_begin
-        self.time_end = time_end
+        self.time_begin = self._to_minutes(time_begin)
+        self.time_end = self._to_minutes(time_end)
+
+        self.week_mask = self._make_week_mask()
+        """The minutes of the week taken up by this meeting time.
+
+        Bit `day * MINUTES_PER_DAY + minute` is set if the meeting time takes
+        up that minute of that day, where `day` is an index into `DAYS`. Two
+        meeting times conflict exactly when their masks share a bit, and the
+        time taken up by several meeting times is the bitwise or of their
+        masks.
+
+        """
 
     def __repr__(self):
-        def time_as_string(time):
+        def time_as_string(minutes):
             return "{hour:02d}:{minute:02d}".format(
-                hour=time.tm_hour,
-                minute=time.tm_min
+                hour=minutes // 60,
+                minute=minutes % 60
             )
 
         return (
@@ -475,36 +1403,92 @@ class MeetingTime:
             )
         )
 
+    def _make_week_mask(self):
+        """Computes the week mask for the meeting time.
+
+        If the mask can't describe the meeting time (because it has an unknown
+        day, or doesn't end after it begins), sets `mask_is_exact` to False so
+        that `conflicts_with` knows not to rely on it.
+
+        """
+        begin = self.time_begin
+        end = self.time_end
+        self.mask_is_exact = begin < end
+
+        if begin >= end:
+            return 0
+
+        day_mask = ((1 << (end - begin)) - 1) << begin
+        week_mask = 0
+        for day in self.day_list:
+            try:
+                day_index = self.DAYS.index(day)
+            except ValueError:
+                self.mask_is_exact = False
+                continue
+            week_mask |= day_mask << (day_index * self.MINUTES_PER_DAY)
+        return week_mask
+
+    @staticmethod
+    def combined_mask(meeting_times):
+        """The week mask for all of the given meeting times together.
+
+        meeting_times: An iterable of `MeetingTime`s.
+
+        """
+        week_mask = 0
+        for i in meeting_times:
+            week_mask |= i.week_mask
+        return week_mask
+
     @property
     def length(self):
-        today = datetime.date.today()
-        return datetime.datetime.combine(
-            today,
-            self.to_datetime_time(self.time_end)
-        ) - datetime.datetime.combine(
-            today,
-            self.to_datetime_time(self.time_begin)
-        )
+        """How long the section meets for, as a `datetime.timedelta`."""
+        return datetime.timedelta(minutes=self.length_minutes)
+
+    @property
+    def length_minutes(self):
+        """How long the section meets for, in minutes."""
+        return self.time_end - self.time_begin
 
     @staticmethod
-    def to_datetime_time(time_struct):
+    def _to_minutes(time_of_day):
+        """Converts a time of day to minutes since midnight.
+
+        time_of_day: The number of minutes since midnight, which is returned
+            as it is, or a `datetime.time` or `time.struct_time`.
+
+        """
+        if isinstance(time_of_day, int):
+            return time_of_day
+        if isinstance(time_of_day, datetime.time):
+            return time_of_day.hour * 60 + time_of_day.minute
+        return time_of_day.tm_hour * 60 + time_of_day.tm_min
+
+    @staticmethod
+    def to_datetime_time(time_of_day):
+        """Converts a time of day to a `datetime.time`.
+
+        time_of_day: The time, in any form `_to_minutes` takes.
+
+        """
+        minutes = MeetingTime._to_minutes(time_of_day)
         return datetime.time(
-            hour=time_struct.tm_hour,
-            minute=time_struct.tm_min
+            hour=minutes // 60,
+            minute=minutes % 60
         )
 
     @staticmethod
     def time_difference(time1, time2):
-        today = datetime.date.today()
-        time1 = datetime.datetime.combine(
-            today,
-            MeetingTime.to_datetime_time(time1)
-        )
-        time2 = datetime.datetime.combine(
-            today,
-            MeetingTime.to_datetime_time(time2)
-        )
-        return time2 - time1
+        """Returns how long after `time1` `time2` is, as a
+        `datetime.timedelta`.
+
+        time1, time2: The times, in any form `_to_minutes` takes.
+
+        """
+        return datetime.timedelta(minutes=(
+            MeetingTime._to_minutes(time2) - MeetingTime._to_minutes(time1)
+        ))
 
     @classmethod
     def from_days_and_times(cls, days, times):
@@ -513,6 +1497,29 @@ class MeetingTime:
         days: The days the section meets, like "MoWe".
         time: The time the section meets, like "10:00AM - 12:00PM".
 
+        """
+        day_list, time_begin, time_end = cls._parse_days_and_times(
+            days,
+            times
+        )
+        return cls(
+            list(day_list),
+            time_begin,
+            time_end
+        )
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def _parse_days_and_times(days, times):
+        """Parses the days and times a section meets.
+
+        Lots of sections meet at the same times, so the results are cached.
+        Returns a tuple of the days, as a tuple, and the begin and end times,
+        in minutes since midnight.
+
+        days: The days the section meets, like "MoWe".
+        time: The time the section meets, like "10:00AM - 12:00PM".
+
         """
         # Split the string into two-character snippets.
         day_list = [""]
@@ -521,17 +1528,28 @@ class MeetingTime:
                 day_list.append("")
             day_list[-1] += i
 
-        # Assume the time string is in the format "11:00 AM - 1:00 PM".
+        # Assume the time string is in the format "11:00AM - 1:00PM". This
+        # takes the same strings as `time.strptime` with "%I:%M%p".
         def convert_time(time_str):
-            time_str = time_str.strip()
-            return time.strptime(time_str, "%I:%M%p")
+            match = re.fullmatch(
+                r"(1[0-2]|0[1-9]|[1-9]):([0-5]\d|\d)([AP]M)",
+                time_str.strip(),
+                re.IGNORECASE
+            )
+            if not match:
+                raise ValueError(
+                    "Time '{time}' isn't like '10:00AM'.".format(
+                        time=time_str
+                    )
+                )
+            hour, minute, period = match.groups()
+            hour = int(hour) % 12
+            if period.upper() == "PM":
+                hour += 12
+            return hour * 60 + int(minute)
         time_begin, time_end = list(map(convert_time, times.split("-")))
 
-        return cls(
-            day_list,
-            time_begin,
-            time_end
-        )
+        return tuple(day_list), time_begin, time_end
 
     def conflicts_with(self, other):
         """Whether or not this meeting time conflicts with another.
@@ -544,6 +1562,9 @@ class MeetingTime:
         other: The other meeting time.
 
         """
+        if self.mask_is_exact and other.mask_is_exact:
+            return bool(self.week_mask & other.week_mask)
+
         # They have to meet on the same day to conflict.
         if not(set(self.day_list) & set(other.day_list)):
             return False
@@ -564,14 +1585,72 @@ class Section:
 
     This is one of the lecture or discussion or lab sections.
 
+    Everything is read out of the JSON information once, when the section is
+    made, and the JSON itself is only kept if it's asked for; otherwise, it's
+    read again from the class API the first time `info` is used, and kept
+    from then on. Strings which lots of sections have in common, like the
+    class code, are interned.
+
     """
-    def __init__(self, info):
+    __slots__ = [
+        "_info",
+        "_class_api",
+        "class_number",
+        "term_code",
+        "subject",
+        "number",
+        "code",
+        "name",
+        "section_type",
+        "section_number",
+        "section",
+        "days",
+        "times",
+        "location",
+        "_meeting_time",
+        "_building",
+    ]
+
+    def __init__(self, info, keep_info=False, class_api=None):
         """Constructor.
 
         info: The JSON information for the class.
+        keep_info: Whether to keep the JSON information in memory.
+        class_api: The ClassAPI instance to read the JSON information from
+            again if it isn't kept.
 
         """
-        self.info = info
+        self._info = info if keep_info else None
+        self._class_api = class_api
+        self.class_number = info.get("ClassNumber")
+        self.term_code = _intern(info["TermCode"])
+        self.subject = _intern(info["SubjectCode"])
+        self.number = _intern(info["CatalogNumber"])
+        self.code = _intern(self._get_code(info))
+        self.name = _intern(info["CourseDescr"])
+        self.section_type = _intern(info["SectionType"])
+        self.section_number = _intern(info["SectionNumber"])
+        self.section = "{section_type} {section_number}".format(
+            section_type=self.section_type,
+            section_number=self.section_number
+        )
+
+        # For the time being, there's a bug in which a class may have
+        # multiple meeting times, which is not what we expected. Here, we
+        # take the first in that case.
+        meeting = info["Meeting"]
+        if isinstance(meeting, list):
+            logger.warning(
+                "For class '{}', expected Meeting from the API to be a single "
+                "dict, but got a list of dicts instead. Using the first "
+                "one.".format(
+                    self.code
+                )
+            )
+            meeting = meeting[0]
+        self.days = _intern(meeting["Days"])
+        self.times = _intern(meeting["Times"])
+        self.location = _intern(meeting["Location"])
 
     def __repr__(self):
         """Repr."""
@@ -591,95 +1670,46 @@ class Section:
             )
         )
 
-    @property
-    def code(self):
-        """The class code, like "EECS 280".
+    @staticmethod
+    def _get_code(info):
+        """Returns the class code of a section, like "EECS 280".
 
-        TODO: Rename to `class_code`.
+        info: The JSON information for the section.
 
         """
         return "{subject} {number}".format(
-            subject=self.subject,
-            number=self.number,
-            section_number=self.section_number
+            subject=info["SubjectCode"],
+            number=info["CatalogNumber"]
         )
 
-    def _get_meeting(self):
-        """For the time being, there's a bug in which a class may have multiple
-        meeting times, which is not what we expected. Here, we take the first
-        in that case.
+    @property
+    def info(self):
+        """The JSON information for the section.
+
+        If it wasn't kept, it's read again from the class API's catalog or
+        cache, or fetched if it's not in either, and then kept. It's `None` if
+        it wasn't kept and the section wasn't made with a class API.
 
         """
-        meetings = self.info["Meeting"]
-        if isinstance(meetings, list):
-            logger.warning(
-                "For class '{}', expected Meeting from the API to be a single "
-                "dict, but got a list of dicts instead. Using the first "
-                "one.".format(
-                    self.code
-                )
+        if self._info is None and self._class_api is not None:
+            self._info = self._get_info(
+                self._class_api,
+                self.term_code,
+                self.class_number
             )
-            meetings = meetings[0]
-        return meetings
-
-    @property
-    def days(self):
-        """The days on which the section meets, like "MoWeFr"."""
-        return self._get_meeting()["Days"]
+        return self._info
 
     @property
     def meeting_time(self):
         """The `MeetingTime` for the section."""
         try:
-            return self._meeting_time_cached
+            return self._meeting_time
         except AttributeError:
-            self._meeting_time_cached = MeetingTime.from_days_and_times(
+            self._meeting_time = MeetingTime.from_days_and_times(
                 self.days,
                 self.times
             )
-            return self._meeting_time_cached
-
-    @property
-    def name(self):
-        """The name of the section, like "Prog&Data Struct"."""
-        return self.info["CourseDescr"]
-
-    @property
-    def number(self):
-        """The number of the class, like "280" for EECS 280."""
-        return self.info["CatalogNumber"]
-
-    @property
-    def section(self):
-        """The section, like DIS-002."""
-        return "{section_type} {section_number}".format(
-            section_type=self.section_type,
-            section_number=self.section_number
-        )
-
-    @property
-    def section_number(self):
-        """The section number for the section, like 022 in EECS 280-022."""
-        return self.info["SectionNumber"]
-
-    @property
-    def section_type(self):
-        """The type of the section, like DIS or LEC."""
-        return self.info["SectionType"]
-
-    @property
-    def subject(self):
-        """The subject code for the class, like EECS."""
-        return self.info["SubjectCode"]
-
-    @property
-    def times(self):
-        """The times for the section, like "10:00 AM - 12:00 PM".
-
-        There's no guarantee on exactly how the date is formatted.
-
-        """
-        return self._get_meeting()["Times"]
+            return self._meeting_time
 
     @classmethod
     def from_class_number(cls, class_api, term, class_number):
@@ -697,18 +1727,445 @@ class Section:
         class_number: The class number, like 14009.
 
         """
-        info = class_api.make_request(
-            "/Terms/{TermCode}/Classes/{ClassNumber}".format(
-                TermCode=term.code,
-                ClassNumber=class_number
+        return cls.from_class_numbers(class_api, term, [class_number])[0]
+
+    @classmethod
+    def from_class_numbers(cls, class_api, term, class_numbers):
+        """Makes a list of sections from their class numbers.
+
+        Like `from_class_number`, but the sections are fetched concurrently.
+        Sections which are in the class API's catalog for the term aren't
+        fetched at all.
+
+        class_api: The ClassAPI instance.
+        term: The `Term` instance.
+        class_numbers: The list of class numbers.
+
+        """
+        sections = []
+        for class_number, info in zip(
+            class_numbers,
+            cls._get_infos(class_api, term.code, class_numbers)
+        ):
+            section = cls(info, class_api=class_api)
+            if section.class_number is None:
+                section.class_number = class_number
+            sections.append(section)
+        return sections
+
+    @classmethod
+    def _get_infos(cls, class_api, term_code, class_numbers):
+        """Returns the JSON information for some sections.
+
+        They're read from the class API's catalog for the term if they're in
+        it, and fetched concurrently otherwise.
+
+        class_api: The ClassAPI instance.
+        term_code: The term code.
+        class_numbers: The list of class numbers.
+
+        """
+        infos = {}
+        catalog = class_api.catalogs.get(term_code)
+        if catalog:
+            for i in class_numbers:
+                info = catalog.get_section_info(i)
+                if info is not None:
+                    infos[i] = info
+
+        class_numbers_to_fetch = [
+            i
+            for i
+            in class_numbers
+            if i not in infos
+        ]
+        responses = class_api.make_requests([
+            cls._get_url(term_code, i)
+            for i
+            in class_numbers_to_fetch
+        ])
+        for class_number, response in zip(class_numbers_to_fetch, responses):
+            infos[class_number] = cls._get_info_from_response(response)
+
+        return [
+            infos[i]
+            for i
+            in class_numbers
+        ]
+
+    @classmethod
+    def _get_info(cls, class_api, term_code, class_number):
+        """Returns the JSON information for one section.
+
+        Like `_get_infos`, but the request, if any, is made on this thread
+        rather than by the class API's workers.
+
+        class_api: The ClassAPI instance.
+        term_code: The term code.
+        class_number: The class number.
+
+        """
+        catalog = class_api.catalogs.get(term_code)
+        if catalog:
+            info = catalog.get_section_info(class_number)
+            if info is not None:
+                return info
+
+        return cls._get_info_from_response(class_api.make_request(
+            cls._get_url(term_code, class_number)
+        ))
+
+    @staticmethod
+    def _get_info_from_response(response):
+        """The JSON information for a section, from the response for its
+        URL."""
+        return response["getSOCSectionListByNbrResponse"]["ClassOffered"]
+
+    @staticmethod
+    def _get_url(term_code, class_number):
+        """The URL to get the information for a section from."""
+        return "/Terms/{TermCode}/Classes/{ClassNumber}".format(
+            TermCode=term_code,
+            ClassNumber=class_number
+        )
+
+
+class Catalog:
+    """A local copy of all of the sections in some subjects in a term.
+
+    It's filled in by `Term.prefetch_catalog`. Once it's been given to the
+    `ClassAPI` with `add_catalog`, sections in those subjects are read from it
+    instead of being fetched. It's saved as a single block of compressed JSON.
+
+    """
+    VERSION = 1
+    """The version of the file format."""
+
+    def __init__(self, file_name):
+        """Constructor.
+
+        file_name: The name of the catalog file.
+
+        """
+        self.file_name = file_name
+
+        # The term's info from the "/Terms" request.
+        self.term_info = None
+
+        # The class numbers which searching for each subject found, keyed by
+        # subject.
+        self.subjects = {}
+
+        # Dicts of the info for each section which has been fetched and the
+        # time it was "fetched_at", keyed by class number. Since they're saved
+        # as JSON, the class numbers are strings.
+        self.sections = {}
+
+        # The class numbers of each class, keyed by class code.
+        self.class_numbers = collections.defaultdict(list)
+
+        # How many times each class has been looked up in the catalog, keyed
+        # by class code, so that `Term.sync_catalog` can update them first.
+        # They're kept in their own file, since they're saved by the
+        # processes which look classes up, not the one which syncs.
+        self.queries = collections.Counter()
+
+        # The lookups since the counts were last loaded or saved.
+        self.new_queries = collections.Counter()
+        self.queries_lock = threading.Lock()
+
+    def __len__(self):
+        """Returns the number of sections in the catalog."""
+        return len(self.sections)
+
+    @staticmethod
+    def get_file_name(season):
+        """Returns the usual name of the catalog file for a season.
+
+        season: The season code, such as "FA 2014".
+
+        """
+        return "{season}.catalog".format(
+            season=season.lower().replace(" ", "_")
+        )
+
+    @property
+    def term_code(self):
+        """The code of the catalog's term."""
+        return self.term_info["TermCode"]
+
+    def has_subject(self, subject):
+        """Whether all of the sections in a subject are in the catalog.
+
+        subject: The subject code, like "EECS".
+
+        """
+        return subject in self.subjects and all(
+            str(i) in self.sections
+            for i
+            in self.subjects[subject]
+        )
+
+    def add_subject(self, subject, class_numbers):
+        """Records the sections in a subject, so that they can be fetched.
+
+        subject: The subject code, like "EECS".
+        class_numbers: The class numbers of the sections in it.
+
+        """
+        self.subjects[subject] = class_numbers
+
+    def add_section(self, class_number, info):
+        """Adds a section which has been fetched.
+
+        class_number: The class number of the section.
+        info: The JSON information for the section.
+
+        """
+        self.remove_section(class_number)
+        class_number = str(class_number)
+        self.sections[class_number] = {
+            "info": info,
+            "fetched_at": time.time(),
+        }
+        self.class_numbers[Section._get_code(info)].append(class_number)
+
+    def remove_section(self, class_number):
+        """Removes a section, if it's in the catalog.
+
+        class_number: The class number of the section.
+
+        """
+        class_number = str(class_number)
+        section = self.sections.pop(class_number, None)
+        if section:
+            self.class_numbers[Section._get_code(section["info"])].remove(
+                class_number
+            )
+
+    def record_query(self, class_code):
+        """Counts a lookup of a class.
+
+        class_code: A class code, like "EECS 280".
+
+        """
+        with self.queries_lock:
+            self.queries[class_code] += 1
+            self.new_queries[class_code] += 1
+
+    def get_section_info(self, class_number):
+        """Returns the JSON information for a section, or `None` if it hasn't
+        been fetched.
+
+        class_number: The class number of the section.
+
+        """
+        section = self.sections.get(str(class_number))
+        return section["info"] if section else None
+
+    def get_fetched_at(self, class_number):
+        """Returns the time a section was fetched at, as a timestamp, or
+        `None` if it hasn't been fetched.
+
+        class_number: The class number of the section.
+
+        """
+        section = self.sections.get(str(class_number))
+        return section["fetched_at"] if section else None
+
+    def get_class_numbers(self, class_code):
+        """Returns the class numbers of a class's sections.
+
+        class_code: A class code, like "EECS 280".
+
+        """
+        return list(self.class_numbers.get(class_code, []))
+
+    def load(self):
+        """Load the catalog from disk, if it's been saved."""
+        with self.queries_lock:
+            self.queries = self._read_queries()
+            self.new_queries = collections.Counter()
+
+        try:
+            with open(self.file_name, "rb") as catalog_file:
+                catalog = json.loads(zlib.decompress(
+                    catalog_file.read()
+                ).decode())
+        except IOError:
+            return
+
+        if catalog["version"] != self.VERSION:
+            raise RuntimeError(
+                "Catalog file {file_name} has version {version}, but only "
+                "version {supported_version} is supported.".format(
+                    file_name=self.file_name,
+                    version=catalog["version"],
+                    supported_version=self.VERSION
+                )
+            )
+
+        self.term_info = catalog["term_info"]
+        self.subjects = catalog["subjects"]
+        self.sections = catalog["sections"]
+        self.class_numbers = collections.defaultdict(list)
+        for class_number, section in self.sections.items():
+            self.class_numbers[Section._get_code(section["info"])].append(
+                class_number
+            )
+
+    def save(self):
+        """Save the catalog to disk.
+
+        It's written next to the old file and then renamed over it, so that
+        the file is never half-written.
+
+        """
+        temp_file_name = "{file_name}.{pid}.tmp".format(
+            file_name=self.file_name,
+            pid=os.getpid()
+        )
+        with open(temp_file_name, "wb") as catalog_file:
+            catalog_file.write(zlib.compress(json.dumps({
+                "version": self.VERSION,
+                "term_info": self.term_info,
+                "subjects": self.subjects,
+                "sections": self.sections,
+            }).encode()))
+        os.replace(temp_file_name, self.file_name)
+
+    def save_queries(self):
+        """Adds the lookups counted since the catalog was loaded to the counts
+        on disk.
+
+        Several processes can do this at once.
+
+        """
+        queries_file_name = self.file_name + ".queries"
+        with self.queries_lock, _lock_file(queries_file_name):
+            queries = self._read_queries()
+            queries.update(self.new_queries)
+
+            temp_file_name = "{file_name}.{pid}.tmp".format(
+                file_name=queries_file_name,
+                pid=os.getpid()
+            )
+            with open(temp_file_name, "w") as queries_file:
+                json.dump(queries, queries_file)
+            os.replace(temp_file_name, queries_file_name)
+
+            self.queries = queries
+            self.new_queries = collections.Counter()
+
+    def _read_queries(self):
+        """Returns the counts of lookups of each class saved on disk."""
+        try:
+            with open(self.file_name + ".queries") as queries_file:
+                return collections.Counter(json.load(queries_file))
+        except IOError:
+            return collections.Counter()
+
+
+class CatalogChange:
+    """A change to a section, found by `Term.sync_catalog`."""
+    def __init__(self, class_number, old_info, new_info):
+        """Constructor.
+
+        class_number: The class number of the section.
+        old_info: The JSON information for the section before, or `None` if
+            it was added.
+        new_info: The JSON information for the section now, or `None` if it
+            was removed.
+
+        """
+        self.class_number = class_number
+        self.old_info = old_info
+        self.new_info = new_info
+
+    def __repr__(self):
+        """Repr."""
+        section = Section(self.new_info or self.old_info)
+        if not self.old_info:
+            change = "Added, meeting {new}".format(
+                new=self._describe_meeting(self.new_info)
+            )
+        elif not self.new_info:
+            change = "Removed"
+        else:
+            change = "Moved from {old} to {new}".format(
+                old=self._describe_meeting(self.old_info),
+                new=self._describe_meeting(self.new_info)
+            )
+        return (
+            "<CatalogChange"
+            " {code} {section} ({class_number}):"
+            " {change}"
+            ">".format(
+                code=section.code,
+                section=section.section,
+                class_number=self.class_number,
+                change=change
             )
         )
-        info = info["getSOCSectionListByNbrResponse"]["ClassOffered"]
-        return cls(info)
+
+    def is_moved(self):
+        """Whether the section's meeting times or location changed."""
+        return bool(self.old_info and self.new_info) and (
+            self._describe_meeting(self.old_info) !=
+            self._describe_meeting(self.new_info)
+        )
+
+    @staticmethod
+    def _describe_meeting(info):
+        """Describes when and where a section meets.
+
+        info: The JSON information for the section.
+
+        """
+        section = Section(info)
+        return "{days} {times} in {location}".format(
+            days=section.days,
+            times=section.times,
+            location=section.location
+        )
 
 
 class FileBackedCache:
-    """Cache which saves to a file, which is used for caching API requests."""
+    """Cache which saves to a file, which is used for caching API requests.
+
+    The file starts with a header, followed by blocks of compressed JSON
+    holding the entries, and then a compressed JSON index of which block each
+    entry is in. When the cache is loaded, only the header and index are read;
+    an entry is read from its block in the (memory-mapped) file the first time
+    it's asked for. The last block read is kept, since entries near each other
+    tend to be asked for together. Entries can be dropped from memory again
+    with `forget`: ones which have been read are read from the file again if
+    they're needed, and ones which have been set are moved to a temporary
+    file until the cache is saved.
+
+    Files in the old format, which was one big pickle, aren't read, since
+    unpickling a file can run any code; convert them with
+    `migrate_pickle_cache` first. Values must be serializable as JSON.
+
+    Several processes can share the same file. Saving merges this cache's
+    changes with whatever is on disk at the time, rather than overwriting it,
+    and a lock file makes sure only one process saves at once. Entries which
+    aren't in the cache are looked for again on disk, in case another process
+    has saved them since the file was loaded.
+
+    """
+    MAGIC = b"SMCACHE\0"
+    """The bytes which start every cache file."""
+
+    VERSION = 1
+    """The version of the file format."""
+
+    HEADER = struct.Struct("<8sIQQ")
+    """The header: the magic bytes, the version, and the offset and length of
+    the index."""
+
+    BLOCK_SIZE = 64 * 1024
+    """Roughly how many bytes of JSON to put in each block."""
 
     def __init__(self, file_name):
         """Constructor.
@@ -718,13 +2175,71 @@ class FileBackedCache:
         """
         self.file_name = file_name
 
+        # Values which have been read or set, keyed by key.
+        self.cache = {}
+
+        # The keys whose values have been set since the file was read.
+        self.modified = set()
+
+        # The offset and length of each block in the file, and the block each
+        # key is in.
+        self.blocks = []
+        self.block_numbers = {}
+        self.cache_file = None
+        self.mapped_file = None
+
+        # Identifies the version of the file which is open, so that we can
+        # tell when another process has replaced it.
+        self.file_id = None
+
+        # A tuple of the number of the last block read and its entries, or
+        # `None`.
+        self.last_block = None
+
+        # The temporary file which values which have been set but forgotten
+        # are kept in, and the offset and length of each one in it, keyed by
+        # key.
+        self.spill_file = None
+        self.spilled = {}
+
+        # Held while the file is read or reopened, since requests may be made
+        # from several threads.
+        self.lock = threading.RLock()
+
     def __getitem__(self, key):
         """Get a value by key from the cache.
 
         key: The key corresponding to the value..
 
         """
-        return self.cache[key]
+        try:
+            return self.cache[key]
+        except KeyError:
+            pass
+
+        with self.lock:
+            if key in self.spilled:
+                offset, length = self.spilled[key]
+                self.spill_file.seek(offset)
+                return json.loads(zlib.decompress(
+                    self.spill_file.read(length)
+                ).decode())
+
+            try:
+                block_number = self.block_numbers[key]
+            except KeyError:
+                # Another process may have fetched it since we loaded.
+                if not self._reopen_if_changed():
+                    raise
+                block_number = self.block_numbers[key]
+
+            if self.last_block and self.last_block[0] == block_number:
+                block = self.last_block[1]
+            else:
+                block = self._read_block(block_number)
+                self.last_block = (block_number, block)
+
+        return self.cache.setdefault(key, block[key])
 
     def __setitem__(self, key, value):
         """Cache a value.
@@ -733,7 +2248,10 @@ class FileBackedCache:
         value: The value.
 
         """
-        self.cache[key] = value
+        with self.lock:
+            self.cache[key] = value
+            self.modified.add(key)
+            self.spilled.pop(key, None)
 
     def __contains__(self, key):
         """Returns whether or not there is an item with key `key`.
@@ -741,26 +2259,587 @@ class FileBackedCache:
         key: The key of the item.
 
         """
-        return key in self.cache
+        return (
+            key in self.cache or
+            key in self.block_numbers or
+            key in self.spilled
+        )
+
+    def __len__(self):
+        """Returns the number of items in the cache."""
+        return len(self._get_keys())
+
+    def __iter__(self):
+        """Iterates over the keys in the cache."""
+        return iter(self._get_keys())
+
+    def _get_keys(self):
+        """Returns the set of keys in the cache."""
+        return (
+            self.block_numbers.keys() |
+            self.cache.keys() |
+            self.spilled.keys()
+        )
+
+    def forget(self, key):
+        """Drops a value from memory.
+
+        If it's been read from the cache file, it's read again the next time
+        it's asked for. If it's been set since the cache was loaded, it's
+        written to a temporary file, which it's read from until the cache is
+        saved.
+
+        key: The key of the value.
+
+        """
+        with self.lock:
+            try:
+                value = self.cache.pop(key)
+            except KeyError:
+                return
+            if key not in self.modified:
+                return
+
+            if not self.spill_file:
+                self.spill_file = open(
+                    "{file_name}.{pid}.spill".format(
+                        file_name=self.file_name,
+                        pid=os.getpid()
+                    ),
+                    "w+b"
+                )
+            data = zlib.compress(json.dumps(value).encode())
+            self.spill_file.seek(0, os.SEEK_END)
+            self.spilled[key] = (self.spill_file.tell(), len(data))
+            self.spill_file.write(data)
+
+    def _close_spill_file(self):
+        """Close and delete the temporary file of forgotten values, if there
+        is one."""
+        self.spilled = {}
+        if self.spill_file:
+            self.spill_file.close()
+            os.remove(self.spill_file.name)
+            self.spill_file = None
+
+    def _read_block(self, block_number, raw=False):
+        """Returns a block from the file, as a dict of keys to values.
+
+        block_number: The number of the block.
+        raw: If True, return the compressed bytes of the block instead.
+
+        """
+        offset, length = self.blocks[block_number]
+        block = self.mapped_file[offset:offset + length]
+        if raw:
+            return block
+        return json.loads(zlib.decompress(block).decode())
 
     def load(self):
-        """Load the cache from disk."""
+        """Load the cache's index from disk."""
+        with self.lock:
+            self._close_spill_file()
+            self.cache = {}
+            self.modified = set()
+            self._open_file()
+
+    def _reopen_if_changed(self):
+        """Reopen the cache file if another process has saved it since it was
+        opened, keeping the values which have been read or set.
+
+        Returns whether it was reopened.
+
+        """
+        try:
+            stat = os.stat(self.file_name)
+        except OSError:
+            return False
+        if self._get_file_id(stat) == self.file_id:
+            return False
+
+        self._open_file()
+        return True
+
+    @staticmethod
+    def _get_file_id(stat):
+        """Returns what identifies a version of a file.
+
+        stat: The result of `os.stat` on the file.
+
+        """
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _open_file(self):
+        """Open the cache file and read its index."""
+        self._close_file()
+        self.blocks = []
+        self.block_numbers = {}
+        self.file_id = None
+        self.last_block = None
+
         try:
-            with open(self.file_name, "rb") as cache_file:
-                self.cache = pickle.load(cache_file)
+            cache_file = open(self.file_name, "rb")
         except IOError:
-            self.cache = {}
+            return
+
+        self.file_id = self._get_file_id(os.fstat(cache_file.fileno()))
+        header = cache_file.read(self.HEADER.size)
+        if header[:len(self.MAGIC)] != self.MAGIC:
+            cache_file.close()
+            raise RuntimeError(
+                "Cache file {file_name} isn't in the cache format. If it's "
+                "from an older version, convert it with "
+                "migrate_pickle_cache.".format(
+                    file_name=self.file_name
+                )
+            )
+
+        _, version, index_offset, index_length = self.HEADER.unpack(header)
+        if version != self.VERSION:
+            cache_file.close()
+            raise RuntimeError(
+                "Cache file {file_name} has version {version}, but only "
+                "version {supported_version} is supported.".format(
+                    file_name=self.file_name,
+                    version=version,
+                    supported_version=self.VERSION
+                )
+            )
+
+        self.cache_file = cache_file
+        self.mapped_file = mmap.mmap(
+            cache_file.fileno(),
+            0,
+            access=mmap.ACCESS_READ
+        )
+        index = json.loads(zlib.decompress(
+            self.mapped_file[index_offset:index_offset + index_length]
+        ).decode())
+        self.blocks = index["blocks"]
+        self.block_numbers = index["block_numbers"]
+
+    def save(self):
+        """Save the cache to disk.
+
+        The entries which have been set are merged into what's on disk now,
+        which may have been saved by another process since this cache was
+        loaded. The entries which have been set here win. The new file is
+        written next to the old one and then renamed over it, so that the file
+        is never half-written.
+
+        """
+        with _lock_file(self.file_name):
+            on_disk = FileBackedCache(self.file_name)
+            on_disk.load()
+            temp_file_name = "{file_name}.{pid}.tmp".format(
+                file_name=self.file_name,
+                pid=os.getpid()
+            )
+            try:
+                self._write(temp_file_name, on_disk)
+            except Exception:
+                if os.path.exists(temp_file_name):
+                    os.remove(temp_file_name)
+                raise
+            finally:
+                on_disk._close_file()
+            self._close_file()
+            os.replace(temp_file_name, self.file_name)
+        self.load()
+
+    def _write(self, file_name, on_disk):
+        """Write the merged cache to a file.
+
+        Blocks on disk whose entries haven't been set here are copied over
+        without being decompressed.
+
+        file_name: The name of the file to write.
+        on_disk: The cache as it is on disk now.
+
+        """
+        block_keys = collections.defaultdict(set)
+        for key, block_number in on_disk.block_numbers.items():
+            block_keys[block_number].add(key)
+
+        def get_value(key):
+            if key in self.modified or key not in on_disk:
+                return self[key]
+            return on_disk[key]
+
+        blocks = []
+        block_numbers = {}
+        with open(file_name, "wb") as cache_file:
+            cache_file.write(b"\0" * self.HEADER.size)
+
+            def write_block(block, keys):
+                offset = cache_file.tell()
+                cache_file.write(block)
+                for key in keys:
+                    block_numbers[key] = len(blocks)
+                blocks.append((offset, len(block)))
+
+            for block_number in range(len(on_disk.blocks)):
+                keys = block_keys[block_number]
+                if keys and not keys & self.modified:
+                    write_block(
+                        on_disk._read_block(block_number, raw=True),
+                        keys
+                    )
+
+            # Pack everything else into new blocks.
+            pending = []
+            pending_size = 0
+            keys = (set(self) | set(on_disk)) - block_numbers.keys()
+            for key in sorted(keys):
+                pending.append((key, json.dumps(get_value(key))))
+                pending_size += len(pending[-1][1])
+                if pending_size >= self.BLOCK_SIZE:
+                    write_block(*self._pack_block(pending))
+                    pending = []
+                    pending_size = 0
+            if pending:
+                write_block(*self._pack_block(pending))
+
+            index_offset = cache_file.tell()
+            index_block = zlib.compress(json.dumps({
+                "blocks": blocks,
+                "block_numbers": block_numbers,
+            }).encode())
+            cache_file.write(index_block)
+            cache_file.seek(0)
+            cache_file.write(self.HEADER.pack(
+                self.MAGIC,
+                self.VERSION,
+                index_offset,
+                len(index_block)
+            ))
+
+    @staticmethod
+    def _pack_block(entries):
+        """Makes a block out of some entries.
+
+        Returns a tuple of the compressed block and its keys.
+
+        entries: A list of tuples of keys and their values as JSON.
+
+        """
+        block = "{" + ",".join(
+            "{key}:{value}".format(key=json.dumps(key), value=value)
+            for key, value
+            in entries
+        ) + "}"
+        return zlib.compress(block.encode()), [key for key, _ in entries]
+
+    def _close_file(self):
+        """Close the cache file, if it's open."""
+        if self.mapped_file:
+            self.mapped_file.close()
+            self.mapped_file = None
+        if self.cache_file:
+            self.cache_file.close()
+            self.cache_file = None
+
+
+class SQLiteCache:
+    """Cache which keeps each entry in its own row of an SQLite database.
+
+    Entries are only read from disk when they're asked for, and each one is
+    written as soon as it's set, so nothing is lost if the process dies.
+    Several processes can read the same file at once.
+
+    """
+
+    def __init__(self, file_name):
+        """Constructor.
+
+        file_name: The name of the database file.
+
+        """
+        self.file_name = file_name
+        self.connection = None
+
+        # The connection is shared by every thread making requests.
+        self.lock = threading.Lock()
+
+    def __getitem__(self, key):
+        """Get a value by key from the cache.
+
+        key: The key corresponding to the value.
+
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT value FROM cache WHERE key = ?",
+                (key,)
+            ).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return json.loads(row[0])
+
+    def __setitem__(self, key, value):
+        """Cache a value.
+
+        key: The key for the value.
+        value: The value. It must be serializable as JSON.
+
+        """
+        value = json.dumps(value)
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)",
+                (key, value)
+            )
+
+    def __delitem__(self, key):
+        """Remove a value from the cache.
+
+        key: The key of the value.
+
+        """
+        with self.lock:
+            cursor = self.connection.execute(
+                "DELETE FROM cache WHERE key = ?",
+                (key,)
+            )
+        if not cursor.rowcount:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        """Returns whether or not there is an item with key `key`.
+
+        key: The key of the item.
+
+        """
+        with self.lock:
+            return self.connection.execute(
+                "SELECT 1 FROM cache WHERE key = ?",
+                (key,)
+            ).fetchone() is not None
+
+    def __len__(self):
+        """Returns the number of items in the cache."""
+        with self.lock:
+            return self.connection.execute(
+                "SELECT COUNT(*) FROM cache"
+            ).fetchone()[0]
+
+    def __iter__(self):
+        """Iterates over the keys in the cache."""
+        with self.lock:
+            keys = self.connection.execute("SELECT key FROM cache").fetchall()
+        return (i[0] for i in keys)
+
+    def load(self):
+        """Open the database, making it if it doesn't exist yet."""
+        # With no isolation level, each statement is committed as soon as
+        # it's run.
+        self.connection = sqlite3.connect(
+            self.file_name,
+            timeout=60,
+            isolation_level=None,
+            check_same_thread=False
+        )
+
+        # Write-ahead logging lets readers carry on while another process is
+        # writing.
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, "
+            "value TEXT NOT NULL"
+            ")"
+        )
+
+    def save(self):
+        """Close the database. Everything has already been written."""
+        if self.connection:
+            self.connection.close()
+            self.connection = None
+
+
+class LRUCache:
+    """Cache which keeps the most recently used entries of another in memory.
+
+    Reads which miss go to the other cache, and writes go to both. Once there
+    are too many entries, or they take up too much space, the least recently
+    used ones are dropped from memory (but not from the other cache). If the
+    other cache has a `forget` method, like `FileBackedCache`, it's called
+    with the key of each one, so that the other cache can drop it too.
+
+    """
+
+    def __init__(self, backing_cache, max_entries=None, max_bytes=None):
+        """Constructor.
+
+        backing_cache: The dict-like cache to keep entries from.
+        max_entries: The most entries to keep in memory, or `None` for no
+            limit.
+        max_bytes: The most bytes of entries to keep in memory, or `None` for
+            no limit. An entry's size is the length of its JSON.
+
+        """
+        self.backing_cache = backing_cache
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        # Maps keys to tuples of the value and its size, from least to most
+        # recently used.
+        self.entries = collections.OrderedDict()
+        self.num_bytes = 0
+        self.lock = threading.Lock()
+
+        self.cache_stats = collections.Counter()
+        """Counts of "hits" and "misses" for reads from memory, and of
+        "evictions" of entries from memory."""
+
+    def __getitem__(self, key):
+        """Get a value by key from the cache.
+
+        key: The key corresponding to the value.
+
+        """
+        with self.lock:
+            try:
+                value, _ = self.entries[key]
+            except KeyError:
+                self.cache_stats["misses"] += 1
+            else:
+                self.cache_stats["hits"] += 1
+                self.entries.move_to_end(key)
+                return value
+
+        value = self.backing_cache[key]
+        with self.lock:
+            self._remember(key, value)
+        return value
+
+    def __setitem__(self, key, value):
+        """Cache a value.
+
+        key: The key for the value.
+        value: The value.
+
+        """
+        self.backing_cache[key] = value
+        with self.lock:
+            self._remember(key, value)
+
+    def __contains__(self, key):
+        """Returns whether or not there is an item with key `key`.
+
+        key: The key of the item.
+
+        """
+        with self.lock:
+            if key in self.entries:
+                return True
+        return key in self.backing_cache
+
+    def _remember(self, key, value):
+        """Keeps a value in memory, evicting others to make room.
+
+        The lock must be held.
+
+        key: The key for the value.
+        value: The value.
+
+        """
+        try:
+            _, old_size = self.entries.pop(key)
+            self.num_bytes -= old_size
+        except KeyError:
+            pass
+
+        size = len(json.dumps(value)) if self.max_bytes is not None else 0
+        self.entries[key] = (value, size)
+        self.num_bytes += size
+
+        while self.entries and (
+            (
+                self.max_entries is not None and
+                len(self.entries) > self.max_entries
+            ) or (
+                self.max_bytes is not None and
+                self.num_bytes > self.max_bytes
+            )
+        ):
+            evicted_key, (_, evicted_size) = self.entries.popitem(last=False)
+            self.num_bytes -= evicted_size
+            self.cache_stats["evictions"] += 1
+            if hasattr(self.backing_cache, "forget"):
+                self.backing_cache.forget(evicted_key)
+
+    def load(self):
+        """Load the other cache."""
+        self.backing_cache.load()
 
     def save(self):
-        """Save the cache to disk."""
-        with open(self.file_name, "wb") as cache_file:
-            pickle.dump(self.cache, cache_file)
+        """Save the other cache."""
+        self.backing_cache.save()
+
+
+def migrate_pickle_cache(file_name):
+    """Converts a cache file from the old format, which was one big pickle,
+    to the format `FileBackedCache` reads.
+
+    Unpickling a file can run any code, so only convert cache files which you
+    made yourself. Files which are already in the new format are left alone.
+
+    Returns whether the file was converted.
+
+    file_name: The name of the cache file.
+
+    """
+    with _lock_file(file_name):
+        with open(file_name, "rb") as cache_file:
+            magic = cache_file.read(len(FileBackedCache.MAGIC))
+            if magic == FileBackedCache.MAGIC:
+                return False
+            cache_file.seek(0)
+            entries = pickle.load(cache_file)
+
+        # There's nothing in the new format on disk to merge with, so write
+        # the entries out on their own.
+        cache = FileBackedCache(file_name)
+        for key, value in entries.items():
+            cache[key] = value
+        temp_file_name = "{file_name}.{pid}.tmp".format(
+            file_name=file_name,
+            pid=os.getpid()
+        )
+        try:
+            cache._write(temp_file_name, FileBackedCache(file_name))
+        except Exception:
+            if os.path.exists(temp_file_name):
+                os.remove(temp_file_name)
+            raise
+        os.replace(temp_file_name, file_name)
+    return True
 
 
 @contextlib.contextmanager
-def make_cache(file_name):
-    """Makes a cache which persists to disk."""
-    cache = FileBackedCache(file_name)
+def make_cache(
+    file_name,
+    cache_class=FileBackedCache,
+    max_entries=None,
+    max_bytes=None
+):
+    """Makes a cache which persists to disk.
+
+    file_name: The name of the cache file.
+    cache_class: The type of cache to make, like `FileBackedCache` or
+        `SQLiteCache`.
+    max_entries, max_bytes: If either is given, the cache is wrapped in an
+        `LRUCache` with those limits.
+
+    """
+    cache = cache_class(file_name)
+    if max_entries is not None or max_bytes is not None:
+        cache = LRUCache(
+            cache,
+            max_entries=max_entries,
+            max_bytes=max_bytes
+        )
     cache.load()
     try:
         yield cache